@@ -0,0 +1,59 @@
+"""Logins/s do PBKDF2 para diferentes tamanhos do pool de hashing.
+
+Rode a partir da raiz do projeto (precisa do .streamlit/secrets.toml):
+
+    python benchmarks/bench_hashing.py --logins 200 --workers 1,2,4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.hashing import HashingService, pbkdf2_iterations
+
+
+def run(workers, logins, sessions, iterations):
+    service = HashingService(workers)
+    salt = os.urandom(32)
+    try:
+        # Aquece os processos para não medir o spawn
+        service.hash("aquecimento", salt, iterations)
+        start = time.perf_counter()
+        # Cada thread faz o papel de uma sessão do Streamlit tentando logar
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            list(pool.map(lambda i: service.hash(f"senha-{i}", salt, iterations), range(logins)))
+        elapsed = time.perf_counter() - start
+    finally:
+        service.shutdown()
+    stats = service.stats()
+    return {
+        "workers": workers,
+        "logins": logins,
+        "seconds": elapsed,
+        "logins_per_sec": logins / elapsed,
+        "avg_total_ms": stats["avg_total"] * 1000,
+        "avg_wait_ms": stats["avg_wait"] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cpus = os.cpu_count() or 1
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=16, help="logins simultâneos")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, 4, cpus})))
+    parser.add_argument("--iterations", type=int, default=pbkdf2_iterations())
+    args = parser.parse_args()
+
+    print(f"CPUs: {cpus}  iterações: {args.iterations}  sessões simultâneas: {args.sessions}")
+    print(f"{'workers':>8} {'logins/s':>10} {'média ms':>10} {'fila ms':>10}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        r = run(workers, args.logins, args.sessions, args.iterations)
+        print(f"{r['workers']:>8} {r['logins_per_sec']:>10.1f} {r['avg_total_ms']:>10.1f} {r['avg_wait_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Carga de cadastros simultâneos contra um Postgres (use um banco local de teste).
+
+Rode a partir da raiz do projeto (precisa do .streamlit/secrets.toml):
+
+    python benchmarks/load_register.py --users 200 --sessions 16 --duplicates 2
+
+Cada CPF é enviado `--duplicates` vezes ao mesmo tempo por sessões diferentes; só
+um envio pode ganhar. No fim confere a contagem no banco e apaga os usuários criados
+(a menos que --keep).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.hashing import get_hashing_service
+from core.pool import db_connection, pool_limits
+from core.users import register_user
+
+
+def register_timed(cpf):
+    start = time.perf_counter()
+    user_id = register_user(cpf, "senha-de-carga", nome="Carga", sobrenome=cpf, cidade="Teste")
+    return user_id, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="CPFs distintos")
+    parser.add_argument("--sessions", type=int, default=16, help="cadastros em paralelo")
+    parser.add_argument("--duplicates", type=int, default=2, help="envios simultâneos de cada CPF")
+    parser.add_argument("--keep", action="store_true", help="não apaga os usuários criados")
+    args = parser.parse_args()
+
+    # Prefixo 9 + número da rodada: não colide com CPFs reais nem com rodadas anteriores
+    run = random.randrange(10000)
+    cpfs = [f"9{run:04d}{i:06d}" for i in range(args.users)]
+    submissions = [cpf for cpf in cpfs for _ in range(args.duplicates)]
+    random.shuffle(submissions)
+
+    get_hashing_service().hash("aquecimento", b"0" * 32)  # não mede o spawn dos workers
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        results = list(pool.map(register_timed, submissions))
+    elapsed = time.perf_counter() - start
+
+    created = [user_id for user_id, _ in results if user_id is not None]
+    latencies = sorted(latency for _, latency in results)
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM users WHERE cpf = ANY(%s)", (cpfs,))
+        in_db = cur.fetchone()[0]
+        if not args.keep:
+            cur.execute("DELETE FROM users WHERE cpf = ANY(%s)", (cpfs,))
+
+    print(f"envios: {len(submissions)} ({args.users} CPFs x {args.duplicates}), "
+          f"sessões: {args.sessions}, pool: {pool_limits()[1]} conexões")
+    print(f"tempo: {elapsed:.2f}s, {len(submissions) / elapsed:.1f} cadastros/s")
+    print(f"latência p50: {statistics.median(latencies) * 1000:.0f}ms, "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms")
+    print(f"criados: {len(created)}, recusados como duplicados: {len(results) - len(created)}, "
+          f"no banco: {in_db}")
+    ok = len(created) == in_db == args.users
+    print("OK" if ok else "FALHOU: cada CPF deveria ser criado exatamente uma vez")
+    get_hashing_service().shutdown()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
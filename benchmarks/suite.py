@@ -0,0 +1,585 @@
+"""Benchmarks sem interface dos caminhos quentes do painel e da autenticação.
+
+Rode a partir da raiz do projeto:
+
+    python benchmarks/suite.py --scales 10,100,1000 --output bench.json
+    python benchmarks/suite.py --compare bench-main.json --output bench.json
+
+Cada cenário roda num processo próprio, sobre uma cópia sintética de
+documentos/download.xlsx com as linhas multiplicadas pela escala
+(benchmarks/synthetic.py). Para cada um o JSON traz tempo de parede, pico de RSS
+e idas ao banco (core.pool.round_trips). As partes de interface usam o AppTest do
+Streamlit; os cenários de autenticação precisam de um Postgres de teste em [db] no
+secrets.toml e são marcados como "skipped" quando ele não responde.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import SOURCE, make_workbook
+
+SCALES = (10, 100, 1000)
+WORKBOOK = os.path.join("documentos", "download.xlsx")  # mesmo caminho que a página usa
+CHART_TYPES = ("Barras", "Pizza", "Linhas")
+AUTH_CALLS = 20
+PAGE_RERUNS = 10
+# CPFs dos cenários de banco começam com 8: não colidem com usuários reais nem com load_register.py
+BENCH_CPF_PREFIX = "8"
+
+SCENARIOS = {}  # nome -> (precisa de banco, depende da escala, gerador)
+
+
+def scenario(name, db=False, scaled=True):
+    """Registra um cenário: um gerador que prepara, entrega a função medida e depois limpa"""
+    def register(func):
+        SCENARIOS[name] = (db, scaled, func)
+        return func
+    return register
+
+
+# --- Memória ---
+
+def _reset_peak_rss():
+    """Zera o pico de RSS do processo (Linux); False quando o sistema não permite"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# --- Cenários de planilha ---
+
+def _drop_conversion_cache():
+    from core.sheets import cache_path
+    shutil.rmtree(cache_path(WORKBOOK), ignore_errors=True)
+
+
+def _report():
+    """O relatório de trabalho como a página o vê: convertido e publicado no catálogo"""
+    from core.catalog import list_reports
+    from core.sheets import ingest_workbook
+    ingest_workbook(WORKBOOK)  # converte fora da medição (só na primeira vez)
+    source = os.path.basename(WORKBOOK)
+    return next(r for r in list_reports(os.path.dirname(WORKBOOK)) if r.source == source)
+
+
+def _sheets():
+    return list(_report().sheet_names)
+
+
+def _prepared():
+    from core.sheets import load_ingested
+    report = _report()
+    return {name: load_ingested(report.path, report.version, name) for name in report.sheet_names}
+
+
+@scenario("ingest")
+def bench_ingest():
+    """O que o ingestor do catálogo faz com um xlsx novo: todas as planilhas + manifest"""
+    from core.sheets import ingest_workbook
+    _drop_conversion_cache()
+    yield lambda: {"sheets": len(ingest_workbook(WORKBOOK)["sheets"])}
+
+
+@scenario("load_data")
+def bench_load_data():
+    """O que load_data faz quando a planilha não está no LRU: lê o catálogo, esquema e totais"""
+    from core.sheets import prepare_frame, read_ingested
+    report = _report()
+    yield lambda: {"rows": sum(len(prepare_frame(read_ingested(report.path, report.version, name)).df)
+                               for name in report.sheet_names)}
+
+
+@scenario("metrics")
+def bench_metrics():
+    """Somas das métricas do painel (esquema + totais) de todas as planilhas"""
+    from core.metrics import build_schema_index, compute_totals
+    frames = [sheet.df for sheet in _prepared().values()]
+
+    def run():
+        for df in frames:
+            compute_totals(df, build_schema_index(df.columns))
+        return {"rows": sum(len(df) for df in frames)}
+    yield run
+
+
+def _chart_cases():
+    """(planilha, tipo, eixo X, coluna de valor) das combinações que a aba Gráficos oferece"""
+    for sheet in _prepared().values():
+        if not sheet.schema['valor']:
+            continue
+        for x_axis in [c for c in ("UF", "MUNICÍPIO") if c in sheet.df.columns]:
+            for chart_type in CHART_TYPES:
+                yield sheet.df, chart_type, x_axis, sheet.schema['valor'][0]
+
+
+@scenario("charts")
+def bench_charts():
+    """Agregação dos gráficos (prepare_chart_data), por tipo e eixo X"""
+    from core.charts import prepare_chart_data
+    cases = list(_chart_cases())
+
+    def run():
+        points = sum(len(prepare_chart_data(*case)) for case in cases)
+        return {"charts": len(cases), "points": points}
+    yield run
+
+
+def _filter_cases(index):
+    """Filtros típicos da barra lateral: uma UF, três UFs, municípios de uma UF, UF + faixa"""
+    from core.filters import Filters
+    if not index.ufs:
+        return []
+    first, several = index.ufs[:1], index.ufs[:3]
+    cases = [Filters(ufs=tuple(first)), Filters(ufs=tuple(several)),
+             Filters(municipios=tuple(index.municipios_of(first)[:20]))]
+    value_columns = [col for col in index.schema['valor'] if index.bounds(col)]
+    if value_columns:
+        low, high = index.bounds(value_columns[0])
+        cases.append(Filters(ufs=tuple(several), ranges=((value_columns[0], low, (low + high) / 2),)))
+    return cases
+
+
+@scenario("filters")
+def bench_filters():
+    """Troca de filtro na página: totais, recorte de linhas e agregação do gráfico"""
+    from core.charts import prepare_chart_data
+    cases = [(sheet, filters) for sheet in _prepared().values() for filters in _filter_cases(sheet.index)]
+
+    def run():
+        rows = 0
+        for sheet, filters in cases:
+            sheet.index._frames.clear()  # cada troca de filtro recorta de novo
+            sheet.index.filtered_totals(filters)
+            frame = sheet.index.frame(filters)
+            if sheet.schema['valor'] and "MUNICÍPIO" in frame.columns:
+                prepare_chart_data(frame, "Barras", "MUNICÍPIO", sheet.schema['valor'][0])
+            rows += len(frame)
+        return {"filters": len(cases), "rows": rows}
+    yield run
+
+
+@scenario("filters_sql")
+def bench_filters_sql():
+    """Como "filters", no motor SQL embutido (DuckDB se instalado, senão SQLite)"""
+    from core.engine import DuckDBBackend, SQLiteBackend, duckdb
+    sheets = _prepared()
+    backend = DuckDBBackend(len(sheets)) if duckdb is not None else SQLiteBackend(len(sheets))
+    cases = [((WORKBOOK, None, name), sheet, filters)
+             for name, sheet in sheets.items() for filters in _filter_cases(sheet.index)]
+    for key, sheet, _ in cases:
+        backend.totals(key, sheet, _filter_cases(sheet.index)[0])  # registra fora da medição
+
+    def run():
+        rows = 0
+        for key, sheet, filters in cases:
+            backend.totals(key, sheet, filters)
+            frame = sheet.df.iloc[backend.positions(key, sheet, filters)]
+            if sheet.schema['valor'] and "MUNICÍPIO" in frame.columns:
+                backend.chart_data(key, sheet, "Barras", "MUNICÍPIO", sheet.schema['valor'][0], filters)
+            rows += len(frame)
+        return {"backend": backend.name, "filters": len(cases), "rows": rows}
+    yield run
+
+
+@scenario("chart_figures")
+def bench_chart_figures():
+    """Montagem das figuras Plotly a partir dos dados já agregados, como na página"""
+    import plotly.express as px
+    from core.charts import prepare_chart_data
+    cases = [(chart_type, x_axis, value_col, prepare_chart_data(df, chart_type, x_axis, value_col))
+             for df, chart_type, x_axis, value_col in _chart_cases()]
+
+    def run():
+        for chart_type, x_axis, value_col, plot_df in cases:
+            color = 'UF' if 'UF' in plot_df.columns and x_axis != 'UF' else None
+            if chart_type == "Barras":
+                px.bar(plot_df, x=x_axis, y=value_col, color=color, template="plotly_white")
+            elif chart_type == "Pizza":
+                px.pie(plot_df, names=x_axis, values=value_col, hole=0.3)
+            else:
+                px.line(plot_df, x=x_axis, y=value_col, color=color)
+        return {"charts": len(cases)}
+    yield run
+
+
+def _bench_export(builder):
+    sheets = _prepared()
+
+    def run():
+        return {"bytes": sum(builder(sheet.df, name).getbuffer().nbytes for name, sheet in sheets.items())}
+    return run
+
+
+@scenario("export_csv")
+def bench_export_csv():
+    """CSV de todas as planilhas (botão Baixar CSV)"""
+    from core.exports import csv_bytes
+    yield _bench_export(lambda df, name: csv_bytes(df))
+
+
+@scenario("export_excel")
+def bench_export_excel():
+    """xlsx de todas as planilhas (botão Baixar Excel)"""
+    from core.exports import excel_bytes
+    yield _bench_export(excel_bytes)
+
+
+# --- Cenários de interface (AppTest) ---
+
+def _dashboard():
+    from streamlit.testing.v1 import AppTest
+    from core.auth import UserSession
+    from core.sheets import ingest_workbook
+    ingest_workbook(WORKBOOK)  # a página só mostra relatórios já catalogados
+    at = AppTest.from_file(os.path.join(ROOT, "pages", "2_pagina.py"), default_timeout=600)
+    # Sessão já logada: o perfil recém-carregado não volta ao banco
+    at.session_state["user"] = UserSession(
+        "00000000000", "Benchmark", "Painel", "Cidade", False, True, 0, time.monotonic()
+    )
+    return at
+
+
+def _run_page(at, sheet=None):
+    if sheet is None:
+        at.run()
+    else:
+        selector = next(s for s in at.selectbox if s.label.startswith("Selecione a planilha"))
+        selector.set_value(sheet).run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+
+@scenario("page_first_run")
+def bench_page_first_run():
+    """Primeira abertura do painel (relatório catalogado, nada ainda em memória)"""
+    at = _dashboard()
+    yield lambda: _run_page(at)
+
+
+@scenario("page_switch_sheets")
+def bench_page_switch_sheets():
+    """Troca por todas as planilhas no seletor (cada uma entra no LRU pela primeira vez)"""
+    names = _sheets()
+    at = _dashboard()
+    _run_page(at)
+
+    def run():
+        for name in names[1:]:
+            _run_page(at, name)
+        return {"reruns": len(names) - 1}
+    yield run
+
+
+@scenario("page_rerun")
+def bench_page_rerun():
+    """Reexecuções sem mudança de planilha (o que cada clique num widget custa)"""
+    at = _dashboard()
+    _run_page(at)
+
+    def run():
+        for _ in range(PAGE_RERUNS):
+            _run_page(at)
+        return {"reruns": PAGE_RERUNS}
+    yield run
+
+
+# --- Cenários de autenticação (Postgres) ---
+
+def _bench_cpfs(tag, count):
+    return [f"{BENCH_CPF_PREFIX}{tag}{i:0{10 - len(tag)}d}" for i in range(count)]
+
+
+def _delete_users(cpfs):
+    from core.pool import db_connection
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE cpf = ANY(%s)", (cpfs,))
+
+
+def _prepare_db():
+    from core.hashing import get_hashing_service
+    from core.migrations import ensure_schema
+    ensure_schema()
+    get_hashing_service().hash("aquecimento", b"0" * 32)  # não mede o spawn dos workers
+
+
+@scenario("verify_user", db=True, scaled=False)
+def bench_verify_user():
+    """Login com senha correta: consulta + PBKDF2"""
+    from core.users import register_user
+    from database import verify_user
+    _prepare_db()
+    cpf, = _bench_cpfs("1", 1)
+    _delete_users([cpf])
+    register_user(cpf, "senha-benchmark", nome="Benchmark", sobrenome="Login", cidade="Teste",
+                  acesso_liberado=True)
+
+    def run():
+        for _ in range(AUTH_CALLS):
+            if not verify_user(cpf, "senha-benchmark"):
+                raise RuntimeError("verify_user recusou a senha do usuário de benchmark")
+        return {"calls": AUTH_CALLS}
+    try:
+        yield run
+    finally:
+        _delete_users([cpf])
+
+
+@scenario("register", db=True, scaled=False)
+def bench_register():
+    """Cadastros em sequência: hash + INSERT ... ON CONFLICT"""
+    from core.users import register_user
+    _prepare_db()
+    cpfs = _bench_cpfs("2", AUTH_CALLS)
+    _delete_users(cpfs)
+
+    def run():
+        for cpf in cpfs:
+            if register_user(cpf, "senha-benchmark", nome="Benchmark", sobrenome="Cadastro",
+                             cidade="Teste") is None:
+                raise RuntimeError(f"CPF {cpf} já estava cadastrado")
+        return {"calls": len(cpfs)}
+    try:
+        yield run
+    finally:
+        _delete_users(cpfs)
+
+
+# --- Execução ---
+
+def _load_secrets(path):
+    import tomllib  # Python 3.11+
+    try:
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def run_child(args):
+    """Um cenário, neste processo; o resultado vai para args.result"""
+    from core.config import configure
+    from core.pool import round_trips
+
+    configure(_load_secrets(args.secrets))
+    if args.scale_dir:
+        os.chdir(args.scale_dir)
+    _, _, func = SCENARIOS[args.child]
+    steps = func()
+    timed = next(steps)
+    try:
+        gc.collect()
+        scoped = _reset_peak_rss()
+        trips = round_trips()
+        start = time.perf_counter()
+        extra = timed() or {}
+        wall = time.perf_counter() - start
+        result = {
+            "wall_s": wall,
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_rss_scope": "scenario" if scoped else "process",
+            "db_round_trips": round_trips() - trips,
+            **extra,
+        }
+    finally:
+        steps.close()  # roda a limpeza do cenário
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def _db_available(secrets):
+    from core.config import configure
+    from core.pool import get_pool
+    if "db" not in secrets:
+        return "sem [db] no secrets.toml"
+    configure(secrets)
+    try:
+        get_pool()
+    except Exception as e:
+        return f"banco indisponível: {e}".strip()
+    return None
+
+
+def _spawn(name, scale_dir, secrets_path, timeout):
+    fd, result = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name,
+           "--secrets", secrets_path, "--result", result]
+    if scale_dir:
+        cmd += ["--scale-dir", scale_dir]
+    try:
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+        if proc.returncode != 0:
+            return {"error": (proc.stderr.strip().splitlines() or ["sem saída"])[-1]}
+        with open(result, encoding="utf-8") as f:
+            return json.load(f)
+    except subprocess.TimeoutExpired:
+        return {"error": f"tempo esgotado ({timeout} s)"}
+    finally:
+        os.remove(result)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Cenários desconhecidos: {', '.join(sorted(unknown))}")
+    scales = [int(s) for s in args.scales.split(",")]
+    secrets_path = os.path.abspath(args.secrets)
+    db_skip = None
+    if any(SCENARIOS[name][0] for name in names):
+        db_skip = _db_available(_load_secrets(secrets_path))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "scales": scales,
+        "rows": {},
+        "results": [],
+    }
+    try:
+        scale_dirs = {}
+        for scale in scales:
+            scale_dir = os.path.join(workdir, f"x{scale}")
+            workbook = os.path.join(scale_dir, WORKBOOK)
+            rows = make_workbook(workbook, scale, os.path.join(ROOT, args.source))
+            report["rows"][str(scale)] = sum(rows.values())
+            scale_dirs[scale] = scale_dir
+
+        for name in names:
+            db, scaled, _ = SCENARIOS[name]
+            for scale in (scales if scaled else [None]):
+                entry = {"scenario": name, "scale": scale}
+                if db and db_skip:
+                    entry["skipped"] = db_skip
+                else:
+                    runs = [_spawn(name, scale_dirs.get(scale), secrets_path, args.timeout)
+                            for _ in range(args.repeat)]
+                    ok = [run for run in runs if "error" not in run]
+                    if len(ok) < len(runs):
+                        entry["error"] = next(run["error"] for run in runs if "error" in run)
+                    if ok:
+                        # Melhor rodada: a menos afetada por ruído da máquina
+                        entry.update(min(ok, key=lambda run: run["wall_s"]))
+                        entry["wall_s_runs"] = [run["wall_s"] for run in ok]
+                report["results"].append(entry)
+                print(_format_entry(entry), file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def _format_entry(entry):
+    label = f"{entry['scenario']:<20} {'' if entry['scale'] is None else entry['scale']:>6}"
+    if "wall_s" not in entry:
+        return f"{label}  {entry.get('skipped') or entry.get('error')}"
+    rss = "-" if entry["peak_rss_mb"] is None else f"{entry['peak_rss_mb']:.0f} MB"
+    line = f"{label} {entry['wall_s'] * 1000:>10.1f} ms {rss:>9} {entry['db_round_trips']:>6} idas"
+    return line + (f"  ({entry['error']})" if "error" in entry else "")
+
+
+def compare(base, report, tolerance):
+    """Compara tempos com um relatório anterior; retorna os cenários que pioraram além da tolerância"""
+    previous = {(r["scenario"], r["scale"]): r for r in base["results"] if "wall_s" in r}
+    regressions = []
+    print(f"\nComparação com {base.get('commit') or 'relatório base'}:", file=sys.stderr)
+    for entry in report["results"]:
+        old = previous.get((entry["scenario"], entry["scale"]))
+        if old is None or "wall_s" not in entry:
+            continue
+        ratio = entry["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        trips = entry["db_round_trips"] - old["db_round_trips"]
+        worse = ratio > 1 + tolerance or trips > 0
+        if worse:
+            regressions.append(entry)
+        print(f"{entry['scenario']:<20} {'' if entry['scale'] is None else entry['scale']:>6} "
+              f"{ratio:>7.2f}x {trips:+6d} idas{'  <-- piorou' if worse else ''}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default=",".join(str(s) for s in SCALES))
+    parser.add_argument("--only", help="cenários separados por vírgula (padrão: todos)")
+    parser.add_argument("--repeat", type=int, default=3, help="rodadas por cenário; vale a melhor")
+    parser.add_argument("--source", default=SOURCE, help="pasta de trabalho usada como modelo")
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"))
+    parser.add_argument("--workdir", help="mantém aqui as pastas sintéticas (padrão: temporário)")
+    parser.add_argument("--timeout", type=float, default=1800, help="segundos por rodada")
+    parser.add_argument("--output", help="arquivo JSON do relatório (padrão: stdout)")
+    parser.add_argument("--compare", help="relatório anterior; sai com erro se algo piorou")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora de tempo aceita (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="lista os cenários e sai")
+    # Uso interno: roda um único cenário no processo filho
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--scale-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+    if args.list:
+        for name, (db, scaled, func) in SCENARIOS.items():
+            print(f"{name:<20} {'banco' if db else 'escala' if scaled else '':<7} {func.__doc__ or ''}")
+        return
+
+    report = run_suite(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        if compare(base, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Pastas de trabalho sintéticas com a forma de documentos/download.xlsx, N vezes maiores.
+
+    python benchmarks/synthetic.py --scale 100 --output /tmp/download_x100.xlsx
+
+Cada planilha mantém as colunas e os tipos da original; as linhas são repetidas
+`scale` vezes, com município/IBGE distintos, UF em rodízio e valores numéricos
+perturbados (semente fixa), para que agrupamentos e top-N tenham trabalho de verdade.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCE = os.path.join("documentos", "download.xlsx")
+UFS = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+    "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+]
+MESES = ["JAN", "FEV", "MAR", "ABR", "MAI", "JUN", "JUL", "AGO", "SET", "OUT", "NOV", "DEZ"]
+
+
+def scale_sheet(df, scale, rng, period=None):
+    """Planilha com `scale` vezes as linhas de `df`; `period` ("AAAA-MM") troca a competência"""
+    n = max(len(df), 1) * scale
+    base = df if len(df) else pd.DataFrame([[None] * len(df.columns)], columns=df.columns)
+    out = base.iloc[np.arange(n) % len(base)].reset_index(drop=True)
+    for col in out.columns:
+        if col == "UF":
+            out[col] = [UFS[i % len(UFS)] for i in range(n)]
+        elif col == "MUNICÍPIO":
+            out[col] = [f"MUNICIPIO {i:06d}" for i in range(n)]
+        elif col == "IBGE":
+            out[col] = 100000 + np.arange(n)
+        elif col == "Comp. CNES" and period:
+            year, month = period.split("-")
+            out[col] = f"{MESES[int(month) - 1]}/{year}"
+        elif pd.api.types.is_float_dtype(out[col]):
+            out[col] = (out[col] * rng.uniform(0.5, 1.5, n)).round(2)
+        elif pd.api.types.is_integer_dtype(out[col]):
+            out[col] = (out[col] * rng.uniform(0.5, 1.5, n)).round().astype(out[col].dtype)
+    return out
+
+
+def make_workbook(output, scale, source=SOURCE, seed=0, period=None):
+    """Grava em `output` a versão `scale`x de `source`; retorna planilha -> linhas"""
+    rng = np.random.default_rng(seed)
+    sheets = pd.read_excel(source, sheet_name=None)
+    # openpyxl em modo write-only: memória constante mesmo no 1000x
+    wb = Workbook(write_only=True)
+    rows = {}
+    for name, df in sheets.items():
+        scaled = scale_sheet(df, scale, rng, period)
+        ws = wb.create_sheet(name)
+        ws.append([str(c) for c in scaled.columns])
+        values = scaled.astype(object).where(scaled.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+        rows[name] = len(scaled)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    wb.save(output)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--source", default=SOURCE)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--period", help="competência AAAA-MM gravada em Comp. CNES")
+    args = parser.parse_args()
+    rows = make_workbook(args.output, args.scale, args.source, args.seed, args.period)
+    print(f"{args.output}: {len(rows)} planilhas, {sum(rows.values())} linhas")
+
+
+if __name__ == "__main__":
+    main()
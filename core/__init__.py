@@ -0,0 +1,5 @@
+"""Núcleo do app sem interface: configuração, banco, autenticação, usuários e planilhas.
+
+Nada aqui chama o Streamlit ao ser importado; recursos caros (pool de conexões,
+workers de hash, migrações) são criados na primeira vez que alguém pede.
+"""
@@ -0,0 +1,113 @@
+import re
+import time
+from typing import NamedTuple
+
+from core.hashing import check_password, decode_record, encode_record, legacy_record, make_password
+from core.pool import db_connection
+from core.users import PROFILE_COLUMNS, SESSION_TTL, changed_since, fetch_profile, users_changed, users_version
+
+
+
+# Resultado de authenticate()
+LOGIN_OK = "ok"
+LOGIN_BLOCKED = "bloqueado"
+LOGIN_INVALID = "invalido"
+
+
+class UserSession(NamedTuple):
+    """Perfil do usuário logado, lido uma vez no login e guardado na sessão"""
+    cpf: str
+    nome: str
+    sobrenome: str
+    cidade: str
+    admin: bool
+    acesso_liberado: bool
+    version: int  # users_version() de antes da leitura
+    loaded_at: float  # time.monotonic() da leitura
+
+    @property
+    def nome_completo(self):
+        return f"{self.nome} {self.sobrenome}"
+
+
+def new_session(row, version):
+    """UserSession a partir de uma linha com as colunas de PROFILE_COLUMNS"""
+    return UserSession(*row, version=version, loaded_at=time.monotonic())
+
+
+def load_user(cpf):
+    # A versão é lida antes da consulta: uma alteração no meio do caminho deixa o perfil vencido
+    version = users_version()
+    row = fetch_profile(cpf)
+    return new_session(row, version) if row else None
+
+
+def is_stale(user):
+    return time.monotonic() - user.loaded_at > SESSION_TTL or changed_since(user.cpf, user.version)
+
+
+def is_valid_cpf(cpf):
+    """Valida formato do CPF"""
+    return re.fullmatch(r'\d{11}', cpf) is not None
+
+
+def set_password(cpf, password):
+    """Grava a senha com o custo atual (registro novo + colunas antigas)"""
+    record = make_password(password)
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET password_hash = %s, salt = %s, password_record = %s WHERE cpf = %s",
+            (record.digest, record.salt, encode_record(record), cpf)
+        )
+
+
+def authenticate(cpf, password):
+    """Confere CPF e senha e lê o perfil na mesma consulta.
+
+    Retorna (status, UserSession ou None); status é LOGIN_OK, LOGIN_BLOCKED ou
+    LOGIN_INVALID. Erros de banco sobem para quem chamou.
+    """
+    version = users_version()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"SELECT password_hash, salt, password_record, {', '.join(PROFILE_COLUMNS)} FROM users WHERE cpf = %s",
+            (cpf,)
+        )
+        result = cur.fetchone()
+    if not result:
+        return LOGIN_INVALID, None
+
+    stored_hash, salt, password_record = result[:3]
+    user = new_session(result[3:], version)
+    if not user.acesso_liberado:
+        return LOGIN_BLOCKED, None
+
+    if password_record:
+        record = decode_record(password_record)
+    else:
+        record = legacy_record(stored_hash, salt)  # converte de memoryview se necessário
+    ok, needs_rehash = check_password(password, record)
+    if not ok:
+        return LOGIN_INVALID, None
+    if needs_rehash:
+        # Registro abaixo do custo atual: regrava agora que temos a senha em mãos
+        try:
+            set_password(cpf, password)
+        except Exception:
+            pass  # o login segue valendo; tenta de novo no próximo
+    return LOGIN_OK, user
+
+
+def user_exists(cpf):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM users WHERE cpf = %s", (cpf,))
+        return cur.fetchone() is not None
+
+
+def promote_to_admin(cpf):
+    """Promove um usuário a admin; retorna se o CPF existia"""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET admin = TRUE WHERE cpf = %s", (cpf,))
+        promoted = cur.rowcount > 0
+    users_changed([cpf])
+    return promoted
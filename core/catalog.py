@@ -0,0 +1,211 @@
+"""Catálogo dos relatórios de pagamento da pasta documentos/.
+
+Um ingestor em segundo plano procura pastas de trabalho novas ou alteradas e as
+converte para o cache colunar (core.sheets.ingest_workbook) num processo separado.
+A página só lê os manifests já publicados: um xlsx grande chegando nunca trava uma
+reexecução.
+"""
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from typing import NamedTuple
+
+from core.config import setting, singleton
+from core.sheets import CACHE_DIR_NAME, MANIFEST, cache_path, ingest_workbook, is_current, read_manifest, workbook_version
+
+
+DOCS_DIR = "documentos"
+SCAN_INTERVAL = 30  # segundos entre duas procuras por arquivos novos
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SheetInfo(NamedTuple):
+    name: str
+    rows: int
+    columns: tuple
+    period: str  # "AAAA-MM" ou None
+
+
+class Report(NamedTuple):
+    """Um relatório já convertido, como descrito no manifest"""
+    path: str
+    source: str
+    version: tuple  # (mtime_ns, tamanho) do xlsx quando foi convertido
+    period: str  # competência "AAAA-MM", ou None se não foi reconhecida
+    sheets: tuple  # SheetInfo, na ordem da pasta de trabalho
+
+    @property
+    def label(self):
+        if not self.period:
+            return self.source
+        year, month = self.period.split("-")
+        return f"{month}/{year} — {self.source}"
+
+    @property
+    def sheet_names(self):
+        return [sheet.name for sheet in self.sheets]
+
+
+def catalog_folder():
+    """Pasta dos relatórios; pode ser trocada em [catalog] folder no secrets.toml"""
+    return setting("catalog", "folder", DOCS_DIR)
+
+
+def workbooks(folder):
+    """Pastas de trabalho da pasta, sem os arquivos temporários do Excel (~$...)"""
+    return sorted(
+        path for path in glob.glob(os.path.join(folder, "*.xlsx"))
+        if not os.path.basename(path).startswith("~$")
+    )
+
+
+_reports_cache = {}  # manifest -> (mtime_ns, Report)
+_reports_lock = threading.Lock()
+
+
+def _report(folder, manifest_path):
+    """Report de um manifest completo, relido só quando o arquivo muda"""
+    try:
+        mtime_ns = os.stat(manifest_path).st_mtime_ns
+    except OSError:
+        return None
+    with _reports_lock:
+        cached = _reports_cache.get(manifest_path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    manifest = read_manifest(os.path.dirname(manifest_path))
+    report = None
+    if manifest and manifest.get("complete"):
+        report = Report(
+            path=os.path.join(folder, manifest["source"]),
+            source=manifest["source"],
+            version=(manifest["mtime_ns"], manifest["size"]),
+            period=manifest.get("period"),
+            sheets=tuple(
+                SheetInfo(entry["name"], entry["rows"], tuple(entry["columns"]), entry.get("period"))
+                for entry in manifest["sheets"]
+            ),
+        )
+    with _reports_lock:
+        _reports_cache[manifest_path] = (mtime_ns, report)
+    return report
+
+
+def list_reports(folder):
+    """Relatórios prontos, da competência mais recente para a mais antiga (só lê os manifests)"""
+    manifests = glob.glob(os.path.join(folder, CACHE_DIR_NAME, "*", MANIFEST))
+    reports = [report for report in (_report(folder, path) for path in manifests) if report]
+    return sorted(reports, key=lambda r: (r.period or "", r.source), reverse=True)
+
+
+def needs_ingest(path):
+    """O xlsx ainda não tem um manifest completo (e no formato atual) para a versão atual"""
+    return not is_current(read_manifest(cache_path(path)), workbook_version(path))
+
+
+def prune_orphans(folder):
+    """Remove do cache os relatórios cujo xlsx saiu da pasta"""
+    sources = {os.path.splitext(os.path.basename(path))[0] for path in workbooks(folder)}
+    cache_root = os.path.join(folder, CACHE_DIR_NAME)
+    if not os.path.isdir(cache_root):
+        return
+    for name in os.listdir(cache_root):
+        if name not in sources:
+            shutil.rmtree(os.path.join(cache_root, name), ignore_errors=True)
+
+
+def ingest_in_subprocess(path):
+    """Converte `path` num processo Python novo (python -m core.catalog <path>).
+
+    Um processo à parte e não um ProcessPoolExecutor: o Streamlit troca o __main__
+    pelo script da página e o spawn tentaria reexecutá-lo no filho. A memória do
+    openpyxl também volta ao sistema assim que o processo termina.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get("PYTHONPATH")]))
+    proc = subprocess.run([sys.executable, "-m", "core.catalog", path],
+                          capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"conversão terminou com código {proc.returncode}")
+
+
+class Ingester:
+    """Thread de fundo que mantém o catálogo em dia.
+
+    A conversão (openpyxl, que segura o GIL) roda num processo separado, para não
+    disputar CPU com as sessões do Streamlit.
+    """
+
+    def __init__(self, folder, interval=SCAN_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self.pending = None  # xlsx aguardando conversão na última procura (None: ainda não procurou)
+        self.current = None  # xlsx sendo convertido agora
+        self.errors = {}  # xlsx -> (versão que falhou, mensagem); não tenta de novo a mesma versão
+        self.last_error = None  # falha da última procura (pasta inacessível...)
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="catalog-ingester", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                self.pending = []
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def scan(self):
+        """Uma procura: converte, um por vez, os xlsx novos ou alterados"""
+        prune_orphans(self.folder)
+        pending = []
+        for path in workbooks(self.folder):
+            failed = self.errors.get(path)
+            if needs_ingest(path) and not (failed and failed[0] == workbook_version(path)):
+                pending.append(path)
+        self.pending = pending
+        for path in pending:
+            self.current = path
+            version = workbook_version(path)
+            try:
+                ingest_in_subprocess(path)
+                self.errors.pop(path, None)
+            except Exception as e:
+                self.errors[path] = (version, str(e))
+            finally:
+                self.current = None
+                self.pending = [p for p in self.pending if p != path]
+
+    def wake(self):
+        """Procura agora, sem esperar o intervalo"""
+        self._wake.set()
+
+    @property
+    def busy(self):
+        return self.pending is None or bool(self.pending) or self.current is not None
+
+
+@singleton
+def get_ingester():
+    """Ingestor único por processo, iniciado no primeiro acesso"""
+    return Ingester(catalog_folder(), setting("catalog", "scan_interval", SCAN_INTERVAL, float))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converte relatórios para o catálogo, sem o Streamlit")
+    parser.add_argument("paths", nargs="*", help="xlsx a converter (padrão: os pendentes da pasta)")
+    parser.add_argument("--folder", default=DOCS_DIR)
+    args = parser.parse_args()
+    if not args.paths:
+        prune_orphans(args.folder)
+    for path in args.paths or [p for p in workbooks(args.folder) if needs_ingest(p)]:
+        manifest = ingest_workbook(path)
+        print(f"{path}: {len(manifest['sheets'])} planilhas, competência {manifest['period'] or '?'}")
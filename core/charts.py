@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+
+TOP_N = 20  # categorias mostradas em barras/pizza; o resto vira "Outros"
+MAX_LINE_POINTS = 500  # pontos por série no gráfico de linhas
+OUTROS = "Outros"
+
+
+def _top_n(grouped, x_axis, value_col, series, top_n):
+    """Mantém as top_n categorias de x (pelo total absoluto) e junta o resto em "Outros" """
+    by_x = grouped.groupby(x_axis, dropna=False, sort=False)[value_col].sum()
+    if len(by_x) <= top_n:
+        return grouped
+    top = by_x.abs().nlargest(top_n).index
+    keep = grouped[x_axis].isin(top)
+    rest = grouped[~keep]
+    if series:
+        outros = rest.groupby(series, dropna=False, sort=False)[value_col].sum().reset_index()
+    else:
+        outros = pd.DataFrame({value_col: [rest[value_col].sum()]})
+    outros[x_axis] = OUTROS
+    kept = grouped[keep].copy()
+    # "Outros" é texto; o eixo passa a ser categórico
+    kept[x_axis] = kept[x_axis].astype(str)
+    return pd.concat([kept, outros[kept.columns]], ignore_index=True)
+
+
+def _downsample(frame, value_col, max_points):
+    """Reduz a série a ~max_points, guardando o mínimo e o máximo de cada faixa (preserva picos)"""
+    n = len(frame)
+    if n <= max_points:
+        return frame
+    buckets = max(max_points // 2, 1)
+    bucket = np.arange(n) * buckets // n
+    values = frame[value_col].to_numpy()
+    grouped = pd.Series(values).groupby(bucket)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return frame.iloc[keep]
+
+
+def chart_series(columns, chart_type, x_axis):
+    """Coluna que separa as séries do gráfico (UF), ou None"""
+    return 'UF' if 'UF' in columns and x_axis != 'UF' and chart_type != "Pizza" else None
+
+
+def shape_chart_data(grouped, chart_type, x_axis, value_col, series, top_n=TOP_N, max_points=MAX_LINE_POINTS):
+    """Top-N + "Outros" ou linhas reduzidas a partir da soma por eixo X (e série), na ordem de aparição"""
+    if chart_type in ("Barras", "Pizza"):
+        return _top_n(grouped, x_axis, value_col, series, top_n)
+
+    try:
+        grouped = grouped.sort_values(x_axis, kind="stable")
+    except TypeError:
+        pass  # eixo com tipos misturados: mantém a ordem de aparição
+    if series and len(grouped):  # filtro sem nenhuma linha: não há série para reduzir
+        return pd.concat(
+            [_downsample(part, value_col, max_points)
+             for _, part in grouped.groupby(series, dropna=False, sort=False)],
+            ignore_index=True
+        )
+    return _downsample(grouped.reset_index(drop=True), value_col, max_points).reset_index(drop=True)
+
+
+def prepare_chart_data(df, chart_type, x_axis, value_col, top_n=TOP_N, max_points=MAX_LINE_POINTS):
+    """Agrega a planilha para o gráfico: soma por eixo X (e UF), top-N + "Outros", linhas reduzidas.
+
+    O tamanho do resultado não depende do número de linhas da planilha.
+    """
+    series = chart_series(df.columns, chart_type, x_axis)
+    keys = [x_axis, series] if series else [x_axis]
+    grouped = (
+        df.groupby(keys, dropna=False, sort=False)[value_col]
+        .sum()
+        .reset_index()
+    )
+    return shape_chart_data(grouped, chart_type, x_axis, value_col, series, top_n, max_points)
@@ -0,0 +1,69 @@
+import os
+import threading
+from functools import wraps
+
+
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+_override = None
+
+
+def configure(values):
+    """Usa `values` no lugar do secrets.toml (benchmarks e scripts sem Streamlit)"""
+    global _override
+    _override = values
+
+
+def secrets():
+    """Configuração do app: st.secrets quando o Streamlit está instalado, senão o secrets.toml.
+
+    Lido só quando alguém pede, nunca ao importar o módulo.
+    """
+    if _override is not None:
+        return _override
+    try:
+        import streamlit as st
+    except ImportError:
+        import tomllib  # Python 3.11+
+        with open(SECRETS_FILE, "rb") as f:
+            return tomllib.load(f)
+    return st.secrets
+
+
+def section(name):
+    """Uma seção do secrets.toml ([db], [auth]...), vazia se não existir"""
+    return secrets().get(name, {})
+
+
+def setting(section_name, key, default, cast=str):
+    """Um valor opcional da configuração; sem secrets.toml vale o default"""
+    try:
+        values = section(section_name)
+    except FileNotFoundError:  # inclui o StreamlitSecretNotFoundError
+        values = {}
+    return cast(values.get(key, default))
+
+
+def singleton(factory):
+    """Recurso único por processo, criado na primeira chamada.
+
+    Faz o papel do st.cache_resource fora da interface: se a criação falhar, nada fica
+    guardado e a próxima chamada tenta de novo. `.reset()` descarta a instância atual.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    def reset():
+        with lock:
+            instance.clear()
+
+    get.reset = reset
+    return get
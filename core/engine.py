@@ -0,0 +1,227 @@
+"""Consultas do painel (totais, agregação dos gráficos, filtro de linhas) num motor SQL embutido.
+
+Opcional: em [analytics] backend no secrets.toml, "duckdb" (precisa do pacote duckdb,
+em requirements-optional.txt), "sqlite" (biblioteca padrão) ou "auto" (DuckDB quando
+instalado, senão pandas). Sem configuração fica o caminho em pandas/NumPy (core.filters).
+
+Cada planilha carregada é registrada uma vez por processo como tabela do motor, com
+uma coluna extra com a posição da linha. O DuckDB lê o DataFrame no lugar, só nas
+colunas que a consulta usa, e agrega em várias threads. O filtro devolve só as
+posições das linhas; o recorte sai do DataFrame já carregado, com os mesmos tipos.
+Qualquer erro do motor numa planilha faz ela voltar para o caminho em pandas.
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from core.charts import chart_series, prepare_chart_data, shape_chart_data
+from core.config import setting, singleton
+from core.metrics import totals_from_sums
+
+try:
+    import duckdb  # opcional: motor colunar, lê o DataFrame sem copiar
+except ImportError:
+    duckdb = None
+
+
+BACKENDS = ("auto", "duckdb", "sqlite", "pandas")
+ROW_COLUMN = "__linha"  # posição da linha no DataFrame da planilha
+MAX_TABLES = 16  # planilhas registradas por processo; a mais antiga sai primeiro
+
+
+def quote(name):
+    """Identificador SQL entre aspas (nomes de coluna com espaço, ponto, acento...)"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def where_clause(filters, columns, ufs=()):
+    """WHERE e parâmetros equivalentes a FilterIndex.mask; filtro de coluna ausente é ignorado.
+
+    `ufs` são as UFs da planilha (FilterIndex.ufs). Como no índice, município de UF vazia
+    (ou que a planilha não tem) é o das linhas sem UF, e os valores vão como texto.
+    """
+    parts, params = [], []
+    if filters.ufs and "UF" in columns:
+        parts.append(f'"UF" IN ({", ".join("?" * len(filters.ufs))})')
+        params.extend(str(uf) for uf in filters.ufs)
+    if filters.municipios and "MUNICÍPIO" in columns:
+        places = []
+        for uf, name in filters.municipios:
+            if "UF" not in columns:
+                places.append('"MUNICÍPIO" = ?')
+                params.append(str(name))
+            elif uf in ufs:
+                places.append('("UF" = ? AND "MUNICÍPIO" = ?)')
+                params.extend([str(uf), str(name)])
+            else:
+                places.append('("UF" IS NULL AND "MUNICÍPIO" = ?)')
+                params.append(str(name))
+        parts.append(f"({' OR '.join(places)})")
+    for column, low, high in filters.ranges:
+        if column in columns:
+            parts.append(f"{quote(column)} BETWEEN ? AND ?")
+            params.extend([float(low), float(high)])
+    return (" WHERE " + " AND ".join(parts)) if parts else "", params
+
+
+class SQLBackend:
+    """Base dos motores SQL: monta as consultas; as subclasses registram as tabelas"""
+
+    name = None
+
+    def __init__(self, max_tables=MAX_TABLES):
+        self.max_tables = max_tables
+        self._tables = OrderedDict()  # (path, versão, planilha) -> nome da tabela
+        self._counter = 0
+        self._lock = threading.Lock()  # uma consulta por vez na conexão
+
+    def _table(self, key, sheet):
+        """Nome da tabela da planilha; registra na primeira vez (chamado com o lock)"""
+        if key in self._tables:
+            self._tables.move_to_end(key)
+            return self._tables[key]
+        self._counter += 1
+        name = f"planilha_{self._counter}"
+        self._register(name, sheet.df.assign(**{ROW_COLUMN: np.arange(len(sheet.df))}))
+        self._tables[key] = name
+        while len(self._tables) > self.max_tables:
+            _, dropped = self._tables.popitem(last=False)
+            self._drop(dropped)
+        return name
+
+    def _query(self, key, sheet, sql, params):
+        with self._lock:
+            table = self._table(key, sheet)
+            return self._fetch(sql.replace("{table}", table), params)
+
+    def totals(self, key, sheet, filters):
+        """Totais das métricas com o filtro, como FilterIndex.filtered_totals"""
+        index = sheet.index
+        needed = {col for columns in sheet.schema.values() for col in columns} | {"Desconto"}
+        used = [i for i, col in enumerate(index.numeric) if col in needed]
+        where, params = where_clause(filters, sheet.df.columns, sheet.index.ufs)
+        sums_sql = "".join(f", SUM({quote(index.numeric[i])})" for i in used)
+        row = self._query(key, sheet, f"SELECT COUNT(*){sums_sql} FROM {{table}}{where}", params)[0]
+        sums = np.zeros(len(index.numeric))
+        sums[used] = [value or 0 for value in row[1:]]
+        return totals_from_sums(sheet.schema, index.numeric, sums, index.integer, row[0])
+
+    def positions(self, key, sheet, filters):
+        """Posições, em ordem, das linhas que passam no filtro"""
+        where, params = where_clause(filters, sheet.df.columns, sheet.index.ufs)
+        rows = self._query(key, sheet, f"SELECT {quote(ROW_COLUMN)} FROM {{table}}{where} "
+                                       f"ORDER BY {quote(ROW_COLUMN)}", params)
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def chart_data(self, key, sheet, chart_type, x_axis, value_col, filters):
+        """Como prepare_chart_data, com a soma por eixo X (e UF) feita no motor"""
+        series = chart_series(sheet.df.columns, chart_type, x_axis)
+        keys = [x_axis, series] if series else [x_axis]
+        where, params = where_clause(filters, sheet.df.columns, sheet.index.ufs)
+        group = ", ".join(quote(k) for k in keys)
+        # MIN(posição) reproduz a ordem de aparição do groupby(sort=False)
+        rows = self._query(key, sheet,
+                           f"SELECT {group}, COALESCE(SUM({quote(value_col)}), 0) FROM {{table}}{where} "
+                           f"GROUP BY {group} ORDER BY MIN({quote(ROW_COLUMN)})", params)
+        grouped = pd.DataFrame(rows, columns=keys + [value_col])
+        return shape_chart_data(grouped, chart_type, x_axis, value_col, series)
+
+
+class DuckDBBackend(SQLBackend):
+    name = "duckdb"
+
+    def __init__(self, max_tables=MAX_TABLES):
+        super().__init__(max_tables)
+        self._con = duckdb.connect()
+
+    def _register(self, name, df):
+        self._con.register(name, df)  # visão sobre o DataFrame, sem cópia
+
+    def _drop(self, name):
+        self._con.unregister(name)
+
+    def _fetch(self, sql, params):
+        return self._con.execute(sql, params).fetchall()
+
+
+class SQLiteBackend(SQLBackend):
+    """SQLite em memória: sem dependência extra, mas copia cada planilha e usa uma thread"""
+
+    name = "sqlite"
+
+    def __init__(self, max_tables=MAX_TABLES):
+        super().__init__(max_tables)
+        self._con = sqlite3.connect(":memory:", check_same_thread=False)
+
+    def _register(self, name, df):
+        df.to_sql(name, self._con, index=False)
+        if "UF" in df.columns:
+            self._con.execute(f'CREATE INDEX {name}_uf ON {name} ("UF")')
+
+    def _drop(self, name):
+        self._con.execute(f"DROP TABLE IF EXISTS {name}")
+
+    def _fetch(self, sql, params):
+        return self._con.execute(sql, params).fetchall()
+
+
+def make_backend(choice):
+    """Motor SQL escolhido em [analytics] backend, ou None para o caminho em pandas"""
+    if choice == "duckdb" or (choice == "auto" and duckdb is not None):
+        return DuckDBBackend() if duckdb is not None else None
+    if choice == "sqlite":
+        return SQLiteBackend()
+    return None
+
+
+class QueryEngine:
+    """O que a página consulta: o motor SQL quando há um, senão (ou se ele falhar) pandas"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.failed = {}  # planilha -> erro do motor; ela fica no caminho em pandas
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.backend.name if self.backend else "pandas"
+
+    def _sql(self, key, method, *args):
+        """Resultado do motor SQL, ou None para usar o pandas"""
+        if self.backend is None or key in self.failed:
+            return None
+        try:
+            return getattr(self.backend, method)(key, *args)
+        except Exception as e:
+            with self._lock:
+                self.failed[key] = f"{type(e).__name__}: {e}"
+            return None
+
+    def totals(self, key, sheet, filters):
+        # Sem filtro os totais já vêm prontos com a planilha
+        if not filters.active:
+            return sheet.totals
+        result = self._sql(key, "totals", sheet, filters)
+        return result if result is not None else sheet.index.filtered_totals(filters)
+
+    def frame(self, key, sheet, filters):
+        if not filters.active:
+            return sheet.df
+        positions = self._sql(key, "positions", sheet, filters)
+        return sheet.df.iloc[positions] if positions is not None else sheet.index.frame(filters)
+
+    def chart_data(self, key, sheet, chart_type, x_axis, value_col, filters):
+        result = self._sql(key, "chart_data", sheet, chart_type, x_axis, value_col, filters)
+        if result is not None:
+            return result
+        return prepare_chart_data(sheet.index.frame(filters), chart_type, x_axis, value_col)
+
+
+@singleton
+def get_engine():
+    """Motor de consultas único por processo, conforme [analytics] backend"""
+    choice = setting("analytics", "backend", "pandas")
+    return QueryEngine(make_backend(choice if choice in BACKENDS else "pandas"))
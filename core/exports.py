@@ -0,0 +1,71 @@
+from io import BytesIO, TextIOWrapper
+
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import xlsxwriter  # opcional: escritor xlsx mais rápido e com memória constante
+except ImportError:
+    xlsxwriter = None
+
+
+EXPORT_CHUNK_ROWS = 50000  # linhas convertidas por vez
+XLSX_FAST_ROWS = 50000  # a partir daqui o Excel usa o escritor de streaming
+
+
+def csv_bytes(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    """CSV em UTF-8 gerado por blocos: só um bloco vira texto por vez.
+
+    Devolve o próprio BytesIO, no início: getvalue() faria uma segunda cópia do arquivo.
+    """
+    buffer = BytesIO()
+    text = TextIOWrapper(buffer, encoding="utf-8", newline="")
+    for start in range(0, max(len(df), 1), chunk_rows):
+        df.iloc[start:start + chunk_rows].to_csv(text, index=False, header=start == 0)
+    text.flush()
+    text.detach()
+    buffer.seek(0)
+    return buffer
+
+
+def _rows(df, chunk_rows):
+    """Linhas da planilha em ordem, convertidas por blocos; NaN vira célula vazia, como no to_excel"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def _excel_streaming(df, sheet_name, buffer, chunk_rows):
+    header = [str(c) for c in df.columns]
+    if xlsxwriter is not None:
+        # constant_memory só guarda a linha atual: as células têm de ir linha a linha,
+        # em ordem (o to_excel escreve por coluna e perderia tudo depois da primeira)
+        wb = xlsxwriter.Workbook(buffer, {"constant_memory": True,
+                                          "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+        ws = wb.add_worksheet(sheet_name)
+        ws.write_row(0, 0, header)
+        for i, row in enumerate(_rows(df, chunk_rows), start=1):
+            ws.write_row(i, 0, row)
+        wb.close()
+        return
+    # Sem xlsxwriter: openpyxl em modo write-only, que não monta a planilha em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append(header)
+    for row in _rows(df, chunk_rows):
+        ws.append(row)
+    wb.save(buffer)
+
+
+def excel_bytes(df, sheet_name, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Planilha xlsx num BytesIO (como csv_bytes); para planilhas grandes usa um escritor de streaming"""
+    sheet_name = sheet_name[:31]  # limite do Excel para nome de aba
+    buffer = BytesIO()
+    if len(df) >= XLSX_FAST_ROWS:
+        _excel_streaming(df, sheet_name, buffer, chunk_rows)
+    else:
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,194 @@
+"""Filtros do dashboard (UF, município, faixas de valor) sobre uma planilha carregada.
+
+O índice é montado uma vez por versão da planilha, junto do SheetData: UF e município
+viram códigos inteiros (dicionário) e as somas por UF ficam num cubo pronto. As colunas
+numéricas são lidas direto dos arrays do DataFrame, sem cópia. Um filtro vira uma
+máscara booleana composta sobre os códigos; os totais saem do cubo (só UF) ou de uma
+soma mascarada, e o recorte de linhas é feito uma vez por filtro e reaproveitado pela
+tabela, gráficos e exportação.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from core.metrics import column_sums, numeric_columns, totals_from_sums
+
+
+UF_COLUMN = "UF"
+MUNICIPIO_COLUMN = "MUNICÍPIO"
+FRAME_CACHE_SIZE = 8  # recortes de linhas guardados por planilha
+
+
+class Filters(NamedTuple):
+    """Filtro escolhido na barra lateral; hashable, serve de chave de cache"""
+    ufs: tuple = ()
+    municipios: tuple = ()  # (UF, município)
+    ranges: tuple = ()  # (coluna, mínimo, máximo)
+
+    @property
+    def active(self):
+        return bool(self.ufs or self.municipios or self.ranges)
+
+
+def _encode(series):
+    """Códigos int32 (-1 para vazio) e categorias ordenadas, como texto"""
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int32), pd.Index(uniques.astype(str))
+
+
+def _lookup(codes, size, selected):
+    """Máscara das linhas cujo código está em `selected` (tabela de busca, uma passada)"""
+    table = np.zeros(size + 1, dtype=bool)  # posição extra: código -1 cai nela, sempre False
+    table[list(selected)] = True
+    return table[codes]
+
+
+class FilterIndex:
+    """Códigos, colunas numéricas e cubo por UF de uma planilha; imutável, compartilhado entre sessões"""
+
+    def __init__(self, df, schema):
+        self.df = df
+        self.schema = schema
+        self.rows = len(df)
+
+        self.ufs = []
+        self._uf_codes = None
+        if UF_COLUMN in df.columns:
+            self._uf_codes, ufs = _encode(df[UF_COLUMN])
+            self.ufs = ufs.tolist()
+        self._uf_position = {uf: i for i, uf in enumerate(self.ufs)}
+
+        # Município identificado por (UF, nome): há nomes repetidos em estados diferentes.
+        # Cada par vira o inteiro UF * largura + nome; só arrays, sem um objeto por município
+        self._place_codes = None
+        self._names = pd.Index([], dtype=str)
+        self._width = 1
+        self._pairs = np.zeros(0, dtype=np.int64)  # pares existentes, em ordem
+        if MUNICIPIO_COLUMN in df.columns:
+            names, self._names = _encode(df[MUNICIPIO_COLUMN])
+            self._width = max(len(self._names), 1)
+            ufs = self._uf_codes if self._uf_codes is not None else np.zeros(len(df), dtype=np.int32)
+            ufs = np.where(ufs >= 0, ufs, len(self.ufs)).astype(np.int64)  # UF vazia: posição extra
+            pairs = np.where(names >= 0, ufs * self._width + names, -1)
+            codes, pairs = pd.factorize(pairs, sort=True)
+            if len(pairs) and pairs[0] == -1:  # linhas sem município
+                codes, pairs = codes - 1, pairs[1:]
+            self._place_codes = codes.astype(np.int32)
+            self._pairs = np.asarray(pairs, dtype=np.int64)
+
+        self.numeric, self._arrays, self.integer = numeric_columns(df)
+        self._column = {col: i for i, col in enumerate(self.numeric)}
+        self.totals = totals_from_sums(schema, self.numeric, column_sums(self._arrays), self.integer, self.rows)
+
+        # Cubo: UF x coluna numérica, mais as linhas de cada UF
+        self._cube = np.zeros((len(self.ufs), len(self.numeric)))
+        self._cube_rows = np.zeros(len(self.ufs), dtype=np.int64)
+        if self.ufs:
+            valid = self._uf_codes >= 0
+            codes = self._uf_codes[valid]
+            self._cube_rows = np.bincount(codes, minlength=len(self.ufs))
+            for i, values in enumerate(self._arrays):
+                column = np.nan_to_num(values[valid].astype(np.float64, copy=False))
+                self._cube[:, i] = np.bincount(codes, weights=column, minlength=len(self.ufs))
+
+        self._frames = OrderedDict()  # Filters -> DataFrame recortado
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        # Os arrays numéricos são os do DataFrame (mapeados do arquivo ou contados no SheetData)
+        arrays = [self._cube, self._uf_codes, self._place_codes, self._pairs]
+        return int(sum(a.nbytes for a in arrays if a is not None))
+
+    def bounds(self, column):
+        """(mínimo, máximo) da coluna numérica, ignorando vazios; None se não houver valores"""
+        values = self._arrays[self._column[column]]
+        if not len(values) or (values.dtype.kind == "f" and np.isnan(values).all()):
+            return None
+        return float(np.nanmin(values)), float(np.nanmax(values))
+
+    @property
+    def municipios(self):
+        """(UF, município) de cada município da planilha, por UF e nome"""
+        return self.municipios_of()
+
+    def municipios_of(self, ufs=()):
+        """Municípios da planilha, só das UFs pedidas quando houver"""
+        pairs = self._pairs
+        if ufs:
+            selected = [self._uf_position[uf] for uf in ufs if uf in self._uf_position]
+            pairs = pairs[np.isin(pairs // self._width, selected)]
+        labels = self.ufs + [""]
+        return list(zip([labels[i] for i in (pairs // self._width).tolist()],
+                        self._names[pairs % self._width].tolist()))
+
+    def _place_positions(self, places):
+        """Posições em self._pairs dos (UF, município) pedidos que existem na planilha"""
+        ufs = np.array([self._uf_position.get(uf, len(self.ufs)) for uf, _ in places], dtype=np.int64)
+        # Nomes e pares estão em ordem: busca binária, sem montar tabela de hash
+        names = []
+        for _, name in places:
+            i = bisect.bisect_left(self._names, name)
+            names.append(i if i < len(self._names) and self._names[i] == name else -1)
+        names = np.array(names, dtype=np.int64)
+        values = ufs * self._width + names
+        positions = np.searchsorted(self._pairs, values)
+        found = (names >= 0) & (positions < len(self._pairs))
+        found[found] = self._pairs[positions[found]] == values[found]
+        return positions[found].tolist()
+
+    def mask(self, filters):
+        """Máscara booleana das linhas que passam no filtro (None: todas passam)"""
+        mask = None
+
+        def both(part):
+            return part if mask is None else mask & part
+
+        if filters.ufs and self._uf_codes is not None:
+            selected = [self._uf_position[uf] for uf in filters.ufs if uf in self._uf_position]
+            mask = both(_lookup(self._uf_codes, len(self.ufs), selected))
+        if filters.municipios and self._place_codes is not None:
+            selected = self._place_positions(filters.municipios)
+            mask = both(_lookup(self._place_codes, len(self._pairs), selected))
+        for column, low, high in filters.ranges:
+            if column in self._column:
+                values = self._arrays[self._column[column]]
+                mask = both((values >= low) & (values <= high))  # vazio (NaN) nunca passa
+        return mask
+
+    def filtered_totals(self, filters):
+        """Totais das métricas com o filtro aplicado, no mesmo formato de SheetData.totals"""
+        if not filters.active:
+            return self.totals
+        if filters.ufs and not filters.municipios and not filters.ranges and self.ufs:
+            # Só UF: soma as linhas do cubo, sem olhar a planilha
+            selected = [self._uf_position[uf] for uf in filters.ufs if uf in self._uf_position]
+            sums = self._cube[selected].sum(axis=0)
+            rows = self._cube_rows[selected].sum()
+        else:
+            mask = self.mask(filters)
+            if mask is None:
+                return self.totals  # filtro só de colunas que a planilha não tem
+            rows = np.count_nonzero(mask)
+            sums = column_sums(self._arrays, mask)
+        return totals_from_sums(self.schema, self.numeric, sums, self.integer, rows)
+
+    def frame(self, filters):
+        """Linhas da planilha que passam no filtro; cada recorte é feito uma vez"""
+        if not filters.active:
+            return self.df
+        with self._lock:
+            if filters in self._frames:
+                self._frames.move_to_end(filters)
+                return self._frames[filters]
+        mask = self.mask(filters)
+        frame = self.df if mask is None else self.df[mask]
+        with self._lock:
+            self._frames[filters] = frame
+            while len(self._frames) > FRAME_CACHE_SIZE:
+                self._frames.popitem(last=False)
+        return frame
@@ -0,0 +1,220 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from core.config import setting, singleton
+
+
+ALGORITHM = "pbkdf2_sha256"
+LEGACY_ITERATIONS = 100000  # custo fixo dos registros antigos (só password_hash/salt)
+HASH_TIMEOUT = 30  # segundos
+HASH_QUEUE_PER_WORKER = 4  # acima disso quem chega espera antes de enfileirar
+
+_main_lock = threading.Lock()
+
+# Registro autodescritivo gravado em users.password_record
+PasswordRecord = namedtuple("PasswordRecord", ["algorithm", "iterations", "salt", "digest"])
+
+# Tempo de uma chamada: total (do ponto de vista da sessão), cálculo no worker e espera na fila
+HashTiming = namedtuple("HashTiming", ["total", "compute", "wait"])
+
+
+def pbkdf2_iterations():
+    """Custo alvo; ajuste em [auth] pbkdf2_iterations (veja `python -m core.hashing calibrate`)"""
+    return setting("auth", "pbkdf2_iterations", LEGACY_ITERATIONS, int)
+
+
+def hash_workers():
+    return setting("auth", "hash_workers", os.cpu_count() or 1, int)
+
+
+def _pbkdf2(password, salt, iterations):
+    """Executado no processo worker; devolve o digest e quanto tempo levou"""
+    start = time.perf_counter()
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return digest, time.perf_counter() - start
+
+
+@contextmanager
+def _worker_main():
+    """Workers do spawn iniciam como `python -m core.hashing`, não pela página em execução.
+
+    O Streamlit troca o __main__ pelo script da página; o spawn reexecutaria esse
+    script (login, schema, pool do banco) em cada worker.
+    """
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = sys.modules[__name__]
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+class HashingService:
+    """Pool limitado de processos para o PBKDF2, fora da thread do script"""
+
+    def __init__(self, workers, timeout=HASH_TIMEOUT, history=500):
+        self.workers = workers
+        self._timeout = timeout
+        self._pending = threading.BoundedSemaphore(workers * HASH_QUEUE_PER_WORKER)
+        self._lock = threading.Lock()
+        self._timings = deque(maxlen=history)
+        self._calls = 0
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # spawn em vez de fork: o servidor do Streamlit tem várias threads vivas
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # O spawn sobe cada worker sob demanda; dispara todos agora, com o __main__ certo
+        with _worker_main():
+            for _ in range(self.workers):
+                executor.submit(os.getpid)
+        return executor
+
+    def _run(self, password, salt, iterations):
+        executor = self._executor
+        try:
+            return executor.submit(_pbkdf2, password, salt, iterations).result(timeout=self._timeout)
+        except BrokenProcessPool:
+            # Worker morreu (OOM, kill...), antes ou durante o cálculo: recria o pool e tenta
+            # de novo uma vez. Só a primeira thread que vê o pool quebrado troca o executor
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+                    executor.shutdown(wait=False)
+                executor = self._executor
+            return executor.submit(_pbkdf2, password, salt, iterations).result(timeout=self._timeout)
+
+    def hash(self, password, salt, iterations=None):
+        """Calcula o PBKDF2 num worker (custo padrão: pbkdf2_iterations()); retorna (digest, HashTiming)"""
+        if iterations is None:
+            iterations = pbkdf2_iterations()
+        start = time.perf_counter()
+        with self._pending:
+            digest, compute = self._run(password, salt, iterations)
+        total = time.perf_counter() - start
+        timing = HashTiming(total, compute, max(total - compute, 0.0))
+        with self._lock:
+            self._timings.append(timing)
+            self._calls += 1
+        return digest, timing
+
+    def stats(self):
+        """Resumo das últimas chamadas (tempos em segundos)"""
+        with self._lock:
+            timings = list(self._timings)
+            calls = self._calls
+        if not timings:
+            return {"workers": self.workers, "calls": calls}
+        return {
+            "workers": self.workers,
+            "calls": calls,
+            "avg_total": sum(t.total for t in timings) / len(timings),
+            "avg_compute": sum(t.compute for t in timings) / len(timings),
+            "avg_wait": sum(t.wait for t in timings) / len(timings),
+            "max_total": max(t.total for t in timings),
+            "last": timings[-1],
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+@singleton
+def get_hashing_service():
+    """Serviço único por processo, compartilhado entre as sessões"""
+    return HashingService(hash_workers())
+
+
+def hash_password_timed(password, salt=None):
+    if salt is None:
+        salt = os.urandom(32)
+    digest, timing = get_hashing_service().hash(password, salt)
+    return digest, salt, timing
+
+
+def hash_password(password, salt=None):
+    digest, salt, _ = hash_password_timed(password, salt)
+    return digest, salt
+
+
+def encode_record(record):
+    """Serializa como algoritmo$iterações$salt_b64$digest_b64"""
+    return "$".join([
+        record.algorithm,
+        str(record.iterations),
+        base64.b64encode(record.salt).decode(),
+        base64.b64encode(record.digest).decode(),
+    ])
+
+
+def decode_record(text):
+    algorithm, iterations, salt, digest = text.split("$")
+    return PasswordRecord(algorithm, int(iterations), base64.b64decode(salt), base64.b64decode(digest))
+
+
+def legacy_record(password_hash, salt):
+    """Monta o registro equivalente das colunas antigas password_hash/salt"""
+    return PasswordRecord(ALGORITHM, LEGACY_ITERATIONS, bytes(salt), bytes(password_hash))
+
+
+def _new_record(service, password):
+    salt = os.urandom(32)
+    iterations = pbkdf2_iterations()
+    digest, _ = service.hash(password, salt, iterations)
+    return PasswordRecord(ALGORITHM, iterations, salt, digest)
+
+
+def make_password(password):
+    """Novo registro com o custo configurado atualmente"""
+    return _new_record(get_hashing_service(), password)
+
+
+def check_password(password, record):
+    """Retorna (senha_confere, precisa_rehash)"""
+    if record.algorithm != ALGORITHM:
+        return False, False
+    digest, _ = get_hashing_service().hash(password, record.salt, record.iterations)
+    ok = hmac.compare_digest(digest, record.digest)
+    return ok, ok and record.iterations < pbkdf2_iterations()
+
+
+def calibrate(target_ms, samples=5):
+    """Maior número de iterações (múltiplo de 1000) que cabe em target_ms neste host"""
+    salt = os.urandom(32)
+    probe = 20000
+    best = None
+    for _ in range(samples):
+        start = time.perf_counter()
+        hashlib.pbkdf2_hmac('sha256', b"calibracao", salt, probe)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_iteration = best / probe
+    return max(int(target_ms / 1000 / per_iteration) // 1000 * 1000, 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ferramentas do hash de senhas")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="sugere pbkdf2_iterations para um tempo alvo por login")
+    cal.add_argument("--target-ms", type=float, default=250)
+    args = parser.parse_args()
+
+    iterations = calibrate(args.target_ms)
+    print(f"Atual: {pbkdf2_iterations()} iterações")
+    print(f"Sugerido para ~{args.target_ms:.0f} ms por login neste host: {iterations}")
+    print("\nNo .streamlit/secrets.toml:\n[auth]\npbkdf2_iterations = " + str(iterations))
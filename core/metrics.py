@@ -0,0 +1,136 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# --- CONSTANTES E CONFIGURAÇÕES ---
+COLUNAS_METRICAS = {
+    'valor': [
+        'valor efetivo de repasse', 'implantação', 'componente fixo esf',
+        'vínculo e acompanhamento territorial esf', 'qualidade esf',
+        'valor custeio emulti', 'valor componente qualidade',
+        'valor custeio esb 40h', 'ceo municipal', 'lrpd municipal',
+        'valor', 'total', 'valor eapp municipal'
+    ],
+    'credenciadas': [
+        'qtde. esf credenciadas', 'qtde. emulti credenciadas',
+        'qtde. eap credenciadas', 'qtde. esb ch diferenciada credenciada',
+        'qt. uom credenciada', 'qtde. ecr credenciadas',
+        'qtde. esfrb credenciado', 'qt. acs credenciado',
+        'qtde. ubsf credenciado', 'qtde. microscopista credenciado',
+        'qtde. eapp municipal credenciada'
+    ],
+    'incompletas': [
+        'qtde. esf incompletas - 75%',
+        'qtde. esf incompletas - 50%',
+        'qtde. esf incompletas - 25%'
+    ]
+}
+
+# Categoria -> (termos, modo). 'exato' compara o nome inteiro da coluna;
+# 'contem' aceita a coluna se algum termo aparece dentro do nome.
+CATEGORIAS = {
+    'valor': (COLUNAS_METRICAS['valor'], 'exato'),
+    'valor integral': (['valor integral', 'implantação'], 'exato'),
+    'credenciadas': (COLUNAS_METRICAS['credenciadas'], 'contem'),
+    'incompletas': (COLUNAS_METRICAS['incompletas'], 'contem'),
+    'com portaria': (['qtde. esf com portaria de homologação'], 'contem'),
+    'pagas': (['qtde. esf pagas'], 'contem'),
+    'completas': (['qtde. esf completas'], 'contem'),
+    'incom 75%': (['qtde. esf incompletas - 75%'], 'contem'),
+    'incom 50%': (['qtde. esf incompletas - 50%'], 'contem'),
+    'incom 25%': (['qtde. esf incompletas - 25%'], 'contem'),
+}
+
+
+def _compile_matcher():
+    exact = {}
+    term_categories = {}
+    for category, (terms, mode) in CATEGORIAS.items():
+        for term in terms:
+            target = exact if mode == 'exato' else term_categories
+            target.setdefault(term.lower(), set()).add(category)
+    # Um termo que contém outro também casa com as categorias do menor; assim basta
+    # o casamento mais longo em cada posição, que é o que a alternância devolve.
+    closure = {
+        term: frozenset().union(*(cats for other, cats in term_categories.items() if other in term))
+        for term in term_categories
+    }
+    alternatives = "|".join(re.escape(t) for t in sorted(term_categories, key=len, reverse=True))
+    # Lookahead para achar casamentos sobrepostos numa única varredura do nome
+    pattern = re.compile(f"(?=({alternatives}))")
+    return {name: frozenset(cats) for name, cats in exact.items()}, closure, pattern
+
+
+_EXACT, _TERM_CATEGORIES, _TERM_PATTERN = _compile_matcher()
+
+
+def build_schema_index(columns):
+    """Categoria -> colunas da planilha (na ordem original), numa passada pelos cabeçalhos"""
+    index = {category: [] for category in CATEGORIAS}
+    for col in columns:
+        name = str(col).lower()
+        categories = set(_EXACT.get(name, ()))
+        for match in _TERM_PATTERN.finditer(name):
+            categories.update(_TERM_CATEGORIES[match.group(1)])
+        for category in categories:
+            index[category].append(col)
+    return index
+
+
+def numeric_columns(df):
+    """Colunas numéricas da planilha: (nomes, arrays NumPy, quais são inteiras).
+
+    Os arrays são os do próprio DataFrame sempre que possível (sem cópia); só colunas
+    com nulos do pandas (Int64...) são convertidas para float com NaN.
+    """
+    numeric = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    integer = np.array([pd.api.types.is_integer_dtype(df[c]) or pd.api.types.is_bool_dtype(df[c])
+                        for c in numeric], dtype=bool)
+    arrays = []
+    for col in numeric:
+        values = df[col].to_numpy()
+        if values.dtype.kind not in "iufb":
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        arrays.append(values)
+    return numeric, arrays, integer
+
+
+def column_sums(arrays, rows=None):
+    """Soma de cada coluna ignorando vazios; só nas linhas `rows` (máscara) quando dadas.
+
+    Um np.nansum por coluna, direto sobre os arrays (visões do arquivo mapeado): juntar
+    tudo numa matriz para uma única redução copiaria cada coluna e sai mais lento.
+    """
+    if rows is not None:
+        rows = np.flatnonzero(rows)  # a máscara é percorrida uma vez, não uma por coluna
+    return np.array([np.nansum(values if rows is None else values.take(rows), dtype=np.float64)
+                     for values in arrays])
+
+
+def totals_from_sums(schema, numeric, sums, integer, rows):
+    """Totais das categorias a partir das somas por coluna numérica (ver compute_totals)"""
+    position = {col: i for i, col in enumerate(numeric)}
+
+    def total(columns):
+        idx = [position[c] for c in columns if c in position]
+        if not idx:
+            return None
+        value = sums[idx].sum()
+        return int(value) if integer[idx].all() else float(value)
+
+    totals = {category: total(columns) for category, columns in schema.items()}
+    totals['Desconto'] = total(['Desconto'])
+    totals['registros'] = int(rows)
+    return totals
+
+
+def compute_totals(df, schema):
+    """Totais de todas as categorias a partir de uma soma por coluna numérica.
+
+    Retorna categoria -> total (None quando a planilha não tem a coluna), mais
+    'Desconto' e 'registros'. Soma inteira continua inteira, como no df[cols].sum().sum().
+    """
+    numeric, arrays, integer = numeric_columns(df)
+    return totals_from_sums(schema, numeric, column_sums(arrays), integer, len(df))
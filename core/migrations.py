@@ -0,0 +1,116 @@
+from core.config import singleton
+from core.pool import db_connection
+
+
+# Chave do advisory lock que serializa as migrações entre réplicas do app
+MIGRATION_LOCK_ID = 7242011
+
+# Passos em ordem; cada um roda uma única vez e fica registrado em schema_version.
+# Usam IF NOT EXISTS para aceitar bancos criados pelas versões antigas do init_db().
+MIGRATIONS = [
+    (1, "tabela users", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            cpf VARCHAR(11) UNIQUE NOT NULL,
+            password_hash BYTEA NOT NULL,
+            salt BYTEA NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "coluna autorizado (esquema antigo do database.py)", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS autorizado BOOLEAN DEFAULT FALSE",
+    ]),
+    (3, "dados pessoais: nome, sobrenome, cidade", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS nome VARCHAR(100) NOT NULL DEFAULT 'Nome não informado'",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS sobrenome VARCHAR(100) NOT NULL DEFAULT ''",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cidade VARCHAR(100) NOT NULL DEFAULT ''",
+    ]),
+    (4, "permissões: admin, acesso_liberado", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS admin BOOLEAN DEFAULT FALSE",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS acesso_liberado BOOLEAN DEFAULT TRUE",
+    ]),
+    (5, "registro autodescritivo da senha (hashing.encode_record)", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_record TEXT",
+    ]),
+    (6, "índice da paginação por (created_at, id)", [
+        # Comparação de tupla com NULL não anda a página; fecha a coluna antes
+        "UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL",
+        "ALTER TABLE users ALTER COLUMN created_at SET NOT NULL",
+        "CREATE INDEX IF NOT EXISTS users_created_at_id_idx ON users (created_at DESC, id DESC)",
+    ]),
+    (7, "busca: colunas normalizadas, prefixo de CPF e índices parciais dos filtros", [
+        # Minúsculas e sem acento, calculadas pelo próprio banco (mesmo mapa de core.users)
+        """ALTER TABLE users ADD COLUMN IF NOT EXISTS nome_busca TEXT
+        GENERATED ALWAYS AS (translate(lower(nome), 'áàâãäéèêëíìîïóòôõöúùûüçñ', 'aaaaaeeeeiiiiooooouuuucn')) STORED""",
+        """ALTER TABLE users ADD COLUMN IF NOT EXISTS sobrenome_busca TEXT
+        GENERATED ALWAYS AS (translate(lower(sobrenome), 'áàâãäéèêëíìîïóòôõöúùûüçñ', 'aaaaaeeeeiiiiooooouuuucn')) STORED""",
+        "CREATE INDEX IF NOT EXISTS users_nome_busca_idx ON users (nome_busca text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS users_sobrenome_busca_idx ON users (sobrenome_busca text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS users_cpf_prefix_idx ON users (cpf varchar_pattern_ops)",
+        # Filtros seletivos do painel, já na ordem da paginação
+        """CREATE INDEX IF NOT EXISTS users_bloqueados_idx ON users (created_at DESC, id DESC)
+        WHERE acesso_liberado = FALSE""",
+        """CREATE INDEX IF NOT EXISTS users_admins_idx ON users (created_at DESC, id DESC)
+        WHERE admin = TRUE""",
+    ]),
+    (8, "busca: índices de trigrama (pg_trgm), quando a extensão existir no servidor", [
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS users_nome_busca_trgm_idx ON users USING gin (nome_busca gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS users_sobrenome_busca_trgm_idx ON users USING gin (sobrenome_busca gin_trgm_ops);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_trgm indisponível (%); a busca por nome usa só prefixo', SQLERRM;
+        END $$;
+        """,
+    ]),
+    (9, "login_throttle: baldes de tentativas de login por CPF, compartilhados entre réplicas", [
+        """
+        CREATE TABLE IF NOT EXISTS login_throttle (
+            key TEXT PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            allowed BOOLEAN NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """,
+    ]),
+]
+
+
+def migrate(conn):
+    """Aplica as migrações pendentes numa única transação; retorna as versões aplicadas"""
+    applied = []
+    with conn.cursor() as cur:
+        # Outras réplicas ficam esperando aqui até o commit desta transação
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cur.fetchone()[0]
+
+        for version, description, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            applied.append(version)
+    return applied
+
+
+@singleton
+def ensure_schema():
+    """Roda as migrações uma vez por processo (erros não ficam em cache e tentam de novo)"""
+    with db_connection() as conn:
+        return migrate(conn)
@@ -0,0 +1,170 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2 import pool as pg_pool
+
+from core.config import section, setting, singleton
+
+
+HEALTH_CHECK_IDLE = 30  # conexões ociosas há mais tempo que isso são testadas com SELECT 1
+
+_round_trips = 0
+_round_trips_lock = threading.Lock()
+
+
+def _count_round_trips(n=1):
+    global _round_trips
+    with _round_trips_lock:
+        _round_trips += n
+
+
+def round_trips():
+    """Idas ao servidor feitas pelas conexões do pool neste processo (usado pelos benchmarks)"""
+    with _round_trips_lock:
+        return _round_trips
+
+
+def _pending_begin(conn):
+    # Fora de transação, o psycopg2 manda um BEGIN separado antes do primeiro comando
+    return 1 if not conn.autocommit and conn.status == extensions.STATUS_READY else 0
+
+
+class CountingCursor(extensions.cursor):
+    """Cursor que conta cada comando enviado (e o BEGIN implícito) em round_trips()"""
+
+    def execute(self, query, vars=None):
+        _count_round_trips(1 + _pending_begin(self.connection))
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        # executemany manda um comando por item da lista
+        _count_round_trips(len(vars_list) + _pending_begin(self.connection))
+        return super().executemany(query, vars_list)
+
+
+def _end_transaction(conn, commit):
+    if conn.status != extensions.STATUS_READY:
+        _count_round_trips()  # sem transação aberta, commit/rollback não vão ao servidor
+    if commit:
+        conn.commit()
+    else:
+        conn.rollback()
+
+
+class ConnectionPool:
+    """Pool limitado de conexões, com teste de saúde na retirada"""
+
+    def __init__(self, minconn, maxconn, timeout, **config):
+        config.setdefault("cursor_factory", CountingCursor)
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **config)
+        # O ThreadedConnectionPool falha na hora quando esgota; o semáforo faz a thread esperar
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        # Conexão recém-aberta ou usada há pouco: dispensa o round trip do teste
+        if last_used is None or time.monotonic() - last_used < HEALTH_CHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            _end_transaction(conn, commit=False)
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self._timeout):
+            raise pg_pool.PoolError("Tempo esgotado aguardando conexão livre no pool")
+        try:
+            # Socket velho (servidor reiniciou, timeout de rede...): descarta e tenta a próxima.
+            # Depois de um restart todas as ociosas estão velhas; esvaziadas, o pool abre uma nova
+            while True:
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._forget(conn)
+                self._pool.putconn(conn, close=True)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        close = close or bool(conn.closed)
+        if close:
+            self._forget(conn)
+        else:
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def _forget(self, conn):
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão: commit ao sair, rollback em caso de erro"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            _end_transaction(conn, commit=True)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                _end_transaction(conn, commit=False)
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+def db_config():
+    """Parâmetros de conexão do PostgreSQL na nuvem ([db] no secrets.toml)"""
+    db = section("db")
+    return {
+        'host': db["host"],
+        'database': db["database"],
+        'user': db["user"],
+        'password': db["password"],
+        'port': db["port"],
+        'sslmode': 'require'
+    }
+
+
+def pool_limits():
+    """(mínimo, máximo, timeout em segundos); podem ser sobrescritos em [db] no secrets.toml"""
+    return (
+        setting("db", "pool_min", 1, int),
+        setting("db", "pool_max", 10, int),
+        setting("db", "pool_timeout", 10, float),  # segundos esperando uma conexão livre
+    )
+
+
+@singleton
+def get_pool():
+    """Pool único por processo, compartilhado entre todas as sessões"""
+    return ConnectionPool(*pool_limits(), **db_config())
+
+
+def db_connection():
+    """Atalho: `with db_connection() as conn:` usando o pool do processo"""
+    return get_pool().connection()
@@ -0,0 +1,372 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+from core.config import singleton
+from core.filters import FilterIndex
+from core.metrics import build_schema_index
+
+try:
+    import fcntl  # trava entre processos; não existe no Windows
+except ImportError:
+    fcntl = None
+
+
+CACHE_DIR_NAME = ".cache"  # dentro da pasta dos relatórios (documentos/.cache)
+MANIFEST = "manifest.json"
+CACHE_FORMAT = 2  # muda quando o conteúdo dos arquivos do cache muda (2: sem linhas vazias)
+SHEET_CACHE_MAX_BYTES = 256 * 1024 * 1024  # teto de memória das planilhas carregadas
+PERIOD_COLUMN = "Comp. CNES"  # competência do relatório, ex.: "FEV/2025"
+MESES = {
+    "JAN": 1, "FEV": 2, "MAR": 3, "ABR": 4, "MAI": 5, "JUN": 6,
+    "JUL": 7, "AGO": 8, "SET": 9, "OUT": 10, "NOV": 11, "DEZ": 12,
+}
+
+_manifest_lock = threading.Lock()
+# pandas 2 copia as colunas no concat, a não ser com copy=False; no 3 (copy-on-write) nunca
+# copia e o argumento foi descontinuado
+_CONCAT_NO_COPY = {"copy": False} if int(pd.__version__.split(".")[0]) < 3 else {}
+
+
+def workbook_version(path):
+    """Identificador barato da versão do arquivo (mtime + tamanho), sem ler o conteúdo"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cache_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), CACHE_DIR_NAME, name)
+
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(folder, manifest):
+    # Escreve num temporário e troca de uma vez: leitores nunca veem um manifest pela metade
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(folder, MANIFEST))
+
+
+def _prune(folder, manifest):
+    """Apaga os arquivos de versões anteriores do relatório (os que o manifest não cita)"""
+    keep = {entry["file"] for entry in manifest["sheets"] if entry["file"]}
+    for name in os.listdir(folder):
+        if name.endswith(".feather") and name not in keep:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass  # em uso por outro processo (Windows): sai na próxima limpeza
+
+
+def read_sheet_index(path):
+    """Nomes das planilhas direto do xl/workbook.xml, sem abrir nenhuma célula"""
+    with zipfile.ZipFile(path) as z:
+        rels = ElementTree.fromstring(z.read("_rels/.rels"))
+        target = next(
+            rel.get("Target") for rel in rels
+            if rel.get("Type", "").endswith("/officeDocument")
+        )
+        root = ElementTree.fromstring(z.read(target.lstrip("/")))
+    ns = root.tag[1:root.tag.index("}")] if root.tag.startswith("{") else ""
+    sheets = root.find(f"{{{ns}}}sheets" if ns else "sheets")
+    return [sheet.get("name") for sheet in sheets]
+
+
+def parse_period(value):
+    """Competência como "AAAA-MM" ("FEV/2025", "02/2025", datas); None se não reconhecer"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if hasattr(value, "year") and hasattr(value, "month"):
+        return f"{value.year:04d}-{value.month:02d}"
+    match = re.fullmatch(r"\s*([A-Za-z]{3}|\d{1,2})\s*[/\-.]\s*(\d{4})\s*", str(value))
+    if not match:
+        return None
+    month, year = match.groups()
+    month = int(month) if month.isdigit() else MESES.get(month.upper())
+    if not month or not 1 <= month <= 12:
+        return None
+    return f"{year}-{month:02d}"
+
+
+def detect_period(df):
+    """Competência da planilha, pela coluna Comp. CNES (primeiro valor reconhecido)"""
+    if PERIOD_COLUMN not in df.columns:
+        return None
+    for value in df[PERIOD_COLUMN].dropna().unique()[:10]:
+        period = parse_period(value)
+        if period:
+            return period
+    return None
+
+
+def _workbook_period(sheets):
+    """Competência mais frequente entre as planilhas"""
+    periods = Counter(entry.get("period") for entry in sheets if entry.get("period"))
+    return periods.most_common(1)[0][0] if periods else None
+
+
+def _arrow_safe(df):
+    """Ajusta o que o Arrow não aceita: nomes de coluna não-texto e colunas de tipos misturados"""
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col])
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mesmo tratamento que o st.dataframe dá para colunas mistas
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _arrow_table(df):
+    """Tabela Arrow num único bloco, com NaN mantido como NaN nas colunas float.
+
+    Assim cada coluna numérica do arquivo é um buffer contíguo sem máscara de nulos,
+    que a leitura entrega ao pandas sem copiar (ver _frame).
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, col in enumerate(df.columns):
+        if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind == "f":
+            table = table.set_column(i, table.field(i), pa.array(df[col].to_numpy(), from_pandas=False))
+    return table
+
+
+def _frame(table):
+    """DataFrame sobre os buffers da tabela mapeada, sem cópia onde o formato permite.
+
+    Colunas numéricas sem nulos viram arrays NumPy somente leitura apontando para o
+    arquivo: o sistema mantém uma única cópia no cache de páginas, dividida por todas
+    as sessões e por todos os processos do Streamlit no mesmo host. Textos ficam nos
+    buffers do Arrow quando o pandas usa strings em Arrow; o resto é convertido.
+    """
+    if not table.num_columns:
+        return table.to_pandas()
+    series = []
+    for name, column in zip(table.column_names, table.columns):
+        if (column.num_chunks == 1 and column.null_count == 0
+                and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type))):
+            values = column.chunk(0).to_numpy(zero_copy_only=True)
+            series.append(pd.Series(values, name=name, copy=False))
+        else:
+            series.append(column.to_pandas().rename(name))
+    # concat por coluna mantém um bloco por coluna; o DataFrame(dict) juntaria (e copiaria) os blocos
+    return pd.concat(series, axis=1, **_CONCAT_NO_COPY)
+
+
+def _is_mapped(values):
+    """Array NumPy que é visão de um buffer do Arrow (o arquivo mapeado), sem memória própria"""
+    while isinstance(values, np.ndarray) and values.base is not None:
+        values = values.base
+    return not isinstance(values, np.ndarray)
+
+
+def resident_bytes(df):
+    """Memória que o DataFrame ocupa no processo; colunas mapeadas ficam no cache de páginas"""
+    usage = df.memory_usage(deep=True, index=False)
+    total = df.index.memory_usage()
+    for i, dtype in enumerate(df.dtypes):
+        if not (isinstance(dtype, np.dtype) and _is_mapped(df.iloc[:, i].to_numpy())):
+            total += usage.iloc[i]
+    return int(total)
+
+
+@contextmanager
+def _source_lock(path):
+    """Só um processo converte `path` por vez (várias réplicas do app no mesmo host)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "rb") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _new_manifest(path, mtime_ns, size, digest):
+    return {
+        "source": os.path.basename(path),
+        "mtime_ns": mtime_ns,
+        "size": size,
+        "sha256": digest,
+        "period": None,
+        "format": CACHE_FORMAT,
+        # True quando todas as planilhas estão convertidas (só então o catálogo mostra o relatório)
+        "complete": False,
+        "sheets": [{"name": name, "file": None} for name in read_sheet_index(path)],
+    }
+
+
+def _write_sheet(path, folder, digest, index, name):
+    """Lê uma única planilha com openpyxl, grava em Feather (Arrow IPC) e descreve o resultado"""
+    # Linhas totalmente vazias saem aqui, para a leitura entregar o arquivo como está
+    df = _arrow_safe(pd.read_excel(path, sheet_name=name).dropna(how='all'))
+    # O prefixo do conteúdo separa os arquivos de versões diferentes do mesmo relatório
+    file_name = f"{digest[:12]}-{index:03d}.feather"
+    # Sem compressão e num bloco só, para mapear o arquivo em memória na leitura
+    table = _arrow_table(df)
+    tmp = os.path.join(folder, file_name + ".tmp")
+    feather.write_feather(table, tmp, compression="uncompressed", chunksize=max(table.num_rows, 1))
+    os.replace(tmp, os.path.join(folder, file_name))
+    return {
+        "name": name,
+        "file": file_name,
+        "columns": list(df.columns),
+        "rows": len(df),
+        "period": detect_period(df),
+    }
+
+
+def ingest_workbook(path):
+    """Converte todas as planilhas de `path` e publica o manifest completo de uma vez.
+
+    Enquanto a conversão roda, quem lê o catálogo continua vendo a versão anterior.
+    Outro processo convertendo o mesmo arquivo faz este esperar e aproveitar o
+    resultado. Retorna o manifest publicado.
+    """
+    with _source_lock(path):
+        return _ingest(path)
+
+
+def is_current(manifest, version):
+    """Manifest completo, no formato atual do cache, para a versão `version` do xlsx"""
+    return bool(
+        manifest and manifest.get("complete") and manifest.get("format") == CACHE_FORMAT
+        and (manifest["mtime_ns"], manifest["size"]) == tuple(version)
+    )
+
+
+def _ingest(path):
+    folder = cache_path(path)
+    mtime_ns, size = workbook_version(path)
+    current = read_manifest(folder)
+    if is_current(current, (mtime_ns, size)):
+        return current
+    digest = file_digest(path)
+    if current and current.get("format") != CACHE_FORMAT:
+        current = None  # arquivos de um formato antigo: converte tudo de novo
+    if current and current.get("complete") and current["size"] == size and current["sha256"] == digest:
+        manifest = dict(current, mtime_ns=mtime_ns)
+    else:
+        manifest = _new_manifest(path, mtime_ns, size, digest)
+        os.makedirs(folder, exist_ok=True)
+        manifest["sheets"] = [
+            _write_sheet(path, folder, digest, index, entry["name"])
+            for index, entry in enumerate(manifest["sheets"])
+        ]
+        manifest["period"] = _workbook_period(manifest["sheets"])
+        manifest["complete"] = True
+    if workbook_version(path) != (mtime_ns, size):
+        raise RuntimeError(f"{os.path.basename(path)} mudou durante a conversão")
+    with _manifest_lock:
+        _write_manifest(folder, manifest)
+        _prune(folder, manifest)
+    return manifest
+
+
+def read_ingested(path, version, name, columns=None):
+    """Planilha de um relatório já catalogado, só pelo manifest (nunca abre o xlsx).
+
+    `columns` limita a leitura às colunas pedidas. LookupError se o relatório foi
+    reprocessado depois que `version` foi lida.
+    """
+    folder = cache_path(path)
+    manifest = read_manifest(folder)
+    if not manifest or not manifest.get("complete") or (manifest["mtime_ns"], manifest["size"]) != tuple(version):
+        raise LookupError(f"{os.path.basename(path)} foi atualizado; recarregue a página")
+    entry = next(entry for entry in manifest["sheets"] if entry["name"] == name)
+    table = feather.read_table(os.path.join(folder, entry["file"]), columns=columns, memory_map=True)
+    return _frame(table)
+
+
+class SheetData:
+    """Planilha carregada e o que é derivado dela uma única vez por versão do arquivo"""
+
+    def __init__(self, df, schema, index):
+        self.df = df
+        self.schema = schema  # categoria de métrica -> colunas (metrics.build_schema_index)
+        self.index = index  # códigos, matriz e cubo por UF dos filtros (filters.FilterIndex)
+        self.totals = index.totals  # categoria de métrica -> total, sem filtro
+        # Só o que é do processo: as colunas mapeadas do arquivo não pesam no teto do LRU
+        self.nbytes = resident_bytes(df) + index.nbytes
+
+
+class SheetCache:
+    """LRU de planilhas carregadas, compartilhado pelo processo e limitado por memória"""
+
+    def __init__(self, max_bytes=SHEET_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # chave -> (valor, bytes)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        # Carrega fora do lock para não travar quem pede outra planilha
+        value = loader()
+        size = value.nbytes
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._total += size
+            self._entries.move_to_end(key)
+            # Mantém ao menos a entrada recém-pedida, mesmo que sozinha passe do teto
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total -= evicted
+            return self._entries[key][0]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+def prepare_frame(df):
+    """SheetData de uma planilha: esquema de métricas, totais e índice de filtros, feitos uma vez por versão"""
+    # As linhas vazias já saíram na conversão (_write_sheet): o DataFrame é usado como veio
+    schema = build_schema_index(df.columns)
+    return SheetData(df, schema, FilterIndex(df, schema))
+
+
+@singleton
+def get_sheet_cache():
+    """LRU único por processo: cada planilha ocupa uma entrada, com teto de memória"""
+    return SheetCache()
+
+
+def load_ingested(path, version, name):
+    """SheetData da planilha, do LRU do processo; lê só do catálogo, nunca converte na requisição"""
+    return get_sheet_cache().get((path, tuple(version), name),
+                                 lambda: prepare_frame(read_ingested(path, version, name)))
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import setting, singleton
+from core.pool import db_connection
+
+
+# Limites padrão por CPF e por sessão (podem ser sobrescritos em [auth] no secrets.toml).
+# Um balde começa cheio com BURST tentativas e ganha uma nova a cada REFILL_SECONDS.
+CPF_BURST = 5
+CPF_REFILL_SECONDS = 60
+SESSION_BURST = 10
+SESSION_REFILL_SECONDS = 6
+MAX_BUCKETS = 100000  # baldes guardados em memória por limitador; os mais antigos saem primeiro
+
+TOO_MANY_ATTEMPTS = "Muitas tentativas seguidas. Aguarde um pouco e tente novamente."
+
+# Reabastece e consome numa única instrução: réplicas concorrentes não gastam a mesma ficha
+_TAKE_SHARED = """
+INSERT INTO login_throttle AS t (key, tokens, allowed, updated_at)
+VALUES (%(key)s, %(burst)s - 1, TRUE, now())
+ON CONFLICT (key) DO UPDATE SET
+    tokens = LEAST(%(burst)s, t.tokens + EXTRACT(EPOCH FROM now() - t.updated_at) / %(refill)s)
+        - CASE WHEN LEAST(%(burst)s, t.tokens + EXTRACT(EPOCH FROM now() - t.updated_at) / %(refill)s) >= 1
+               THEN 1 ELSE 0 END,
+    allowed = LEAST(%(burst)s, t.tokens + EXTRACT(EPOCH FROM now() - t.updated_at) / %(refill)s) >= 1,
+    updated_at = now()
+RETURNING allowed, tokens
+"""
+
+
+class TokenBucketLimiter:
+    """Baldes de fichas em memória, um por chave; recusa sem tocar em banco nem em hash"""
+
+    def __init__(self, burst, refill_seconds, max_keys=MAX_BUCKETS):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # chave -> (fichas, instante da última atualização)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_shared = 0  # aceitas aqui, mas recusadas pelo balde no Postgres
+
+    def take(self, key):
+        """Consome uma ficha; retorna 0 se a tentativa pode seguir ou os segundos até a próxima ficha"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) / self.refill_seconds)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) * self.refill_seconds
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def take_shared(self, key):
+        """Mesma regra, no Postgres; só é chamado depois que o balde local aceitou"""
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_TAKE_SHARED, {"key": key, "burst": self.burst, "refill": self.refill_seconds})
+            allowed, tokens = cur.fetchone()
+        if allowed:
+            return 0
+        with self._lock:
+            self.rejected_shared += 1
+        return (1 - tokens) * self.refill_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "aceitas": self.allowed - self.rejected_shared,
+                "recusadas": self.rejected + self.rejected_shared,
+                "recusadas no Postgres": self.rejected_shared,
+                "chaves": len(self._buckets),
+            }
+
+
+@singleton
+def get_limiters():
+    """Limitadores compartilhados por todas as sessões do processo"""
+    return {
+        "sessão": TokenBucketLimiter(
+            setting("auth", "throttle_session_burst", SESSION_BURST, int),
+            setting("auth", "throttle_session_refill_seconds", SESSION_REFILL_SECONDS, float),
+        ),
+        "cpf": TokenBucketLimiter(
+            setting("auth", "throttle_cpf_burst", CPF_BURST, int),
+            setting("auth", "throttle_cpf_refill_seconds", CPF_REFILL_SECONDS, float),
+        ),
+    }
+
+
+def throttle_shared():
+    """Também guarda os baldes por CPF no Postgres (tabela login_throttle), para valer entre réplicas"""
+    return setting("auth", "throttle_shared", False, bool)
+
+
+def check_attempt(session_key, cpf=None):
+    """Pede licença para uma tentativa de login/recuperação da sessão (e do CPF).
+
+    Retorna 0 quando pode seguir ou quantos segundos esperar. Deve ser chamado antes
+    de qualquer consulta ou hash: uma tentativa recusada não custa nada ao servidor.
+    """
+    limiters = get_limiters()
+    wait = limiters["sessão"].take(session_key)
+    if wait or cpf is None:
+        return wait
+    wait = limiters["cpf"].take(cpf)
+    if wait or not throttle_shared():
+        return wait
+    try:
+        return limiters["cpf"].take_shared(f"cpf:{cpf}")
+    except Exception:
+        return 0  # banco fora do ar: vale a decisão local (o login vai falhar ao consultar de qualquer jeito)
+
+
+def throttle_stats():
+    """Tentativas aceitas e recusadas (trabalho de hash e banco evitado) por limitador"""
+    return {name: limiter.stats() for name, limiter in get_limiters().items()}
@@ -0,0 +1,225 @@
+"""Séries mensais das métricas de 'valor' e 'credenciadas' ao longo das competências.
+
+Cada relatório do catálogo é lido uma vez por versão (só as colunas de município e de
+métrica) e somado por código IBGE. As competências formam um eixo mensal contínuo;
+cada métrica vira uma matriz NumPy municípios x meses, com as somas por UF, o total
+nacional e as médias móveis de 3 e 12 meses já calculados. Uma consulta de tendência
+só fatia arrays prontos.
+"""
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from core.config import singleton
+from core.metrics import build_schema_index
+from core.sheets import read_ingested
+
+
+SERIES_CATEGORIES = ("valor", "credenciadas")
+ROLLING_WINDOWS = (3, 12)  # médias móveis pré-calculadas para Brasil e UFs
+KEY_COLUMN = "IBGE"
+PLACE_COLUMNS = ("UF", "MUNICÍPIO")
+
+
+class Metric(NamedTuple):
+    sheet: str
+    column: str
+    category: str  # 'valor' ou 'credenciadas'
+
+    @property
+    def label(self):
+        return f"{self.sheet} · {self.column}"
+
+
+def month_index(period):
+    """"AAAA-MM" -> número de meses desde o ano 0 (eixo contínuo)"""
+    year, month = period.split("-")
+    return int(year) * 12 + int(month) - 1
+
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def rolling_mean(values, window):
+    """Média dos meses presentes na janela que termina em cada mês (último eixo).
+
+    Meses sem dado (NaN) ficam fora da média; NaN só quando a janela inteira está vazia.
+    """
+    if window <= 1:
+        return values
+    present = ~np.isnan(values)
+    sums = np.cumsum(np.where(present, values, 0.0), axis=-1)
+    counts = np.cumsum(present, axis=-1)
+    # Soma acumulada de `window` meses atrás, com zeros antes do começo
+    pad = [(0, 0)] * (values.ndim - 1) + [(window, 0)]
+    sums = sums - np.pad(sums, pad)[..., :-window]
+    counts = counts - np.pad(counts, pad)[..., :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def extract_report(report):
+    """Somas por município de cada métrica de um relatório: Metric -> (códigos, valores).
+
+    Também devolve IBGE -> (UF, município) para os nomes. Lê só as colunas necessárias.
+    """
+    series = {}
+    places = {}
+    for sheet in report.sheets:
+        if KEY_COLUMN not in sheet.columns:
+            continue
+        schema = build_schema_index(sheet.columns)
+        metrics = {}
+        for category in SERIES_CATEGORIES:
+            for col in schema[category]:
+                metrics.setdefault(col, category)
+        if not metrics:
+            continue
+        keys = [KEY_COLUMN] + [c for c in PLACE_COLUMNS if c in sheet.columns]
+        df = read_ingested(report.path, report.version, sheet.name, columns=keys + list(metrics))
+        codes = pd.to_numeric(df[KEY_COLUMN], errors="coerce")
+        df = df[codes.notna()].assign(**{KEY_COLUMN: codes[codes.notna()].astype(np.int64)})
+        if df.empty:
+            continue
+        values = df[list(metrics)].apply(pd.to_numeric, errors="coerce")
+        grouped = values.groupby(df[KEY_COLUMN].to_numpy()).sum(min_count=1)
+        for col, category in metrics.items():
+            series[Metric(sheet.name, col, category)] = (grouped.index.to_numpy(), grouped[col].to_numpy(np.float64))
+        if len(keys) == 3:
+            first = df.drop_duplicates(KEY_COLUMN)
+            places.update(zip(first[KEY_COLUMN], zip(first["UF"].astype(str), first["MUNICÍPIO"].astype(str))))
+    return series, places
+
+
+class TimeSeries:
+    """Métricas alinhadas por município e competência, com os agregados prontos"""
+
+    def __init__(self, extracts):
+        """`extracts`: lista de (competência "AAAA-MM", resultado de extract_report), em ordem"""
+        months = [month_index(period) for period, _ in extracts]
+        self.start = min(months) if months else 0
+        self.periods = [month_label(m) for m in range(self.start, max(months) + 1)] if months else []
+        n_periods = len(self.periods)
+
+        places = {}
+        codes = set()
+        for _, (series, report_places) in extracts:
+            places.update(report_places)  # a competência mais recente dá o nome
+            for metric_codes, _ in series.values():
+                codes.update(metric_codes.tolist())
+        for code in codes - set(places):
+            places[code] = ("?", str(code))  # planilha sem UF/MUNICÍPIO
+        self.codes = np.array(sorted(places), dtype=np.int64)
+        self.places = places
+        self.ufs = sorted({uf for uf, _ in places.values()})
+        uf_position = {uf: i for i, uf in enumerate(self.ufs)}
+        self._code_uf = np.array([uf_position[places[code][0]] for code in self.codes], dtype=np.int64)
+
+        # Métrica -> (posições em self.codes, matriz municípios x meses)
+        self._matrix = {}
+        by_metric = {}
+        for month, (_, (series, _)) in zip(months, extracts):
+            for metric, pair in series.items():
+                by_metric.setdefault(metric, []).append((month - self.start, pair))
+        for metric, parts in by_metric.items():
+            rows = np.unique(np.concatenate([codes for _, (codes, _) in parts]))
+            matrix = np.zeros((len(rows), n_periods))
+            present = np.zeros(n_periods, dtype=bool)
+            for column, (codes, values) in parts:
+                matrix[np.searchsorted(rows, codes), column] = np.nan_to_num(values)
+                present[column] = True
+            # Município ausente de uma planilha que existe no mês = 0; mês sem a planilha = NaN
+            matrix[:, ~present] = np.nan
+            self._matrix[metric] = (np.searchsorted(self.codes, rows), matrix)
+        self.metrics = sorted(self._matrix, key=lambda m: (SERIES_CATEGORIES.index(m.category), m.sheet, m.column))
+
+        # Agregados pré-calculados: janela -> métrica -> matriz UFs x meses / vetor Brasil
+        self._uf = {window: {} for window in (1, *ROLLING_WINDOWS)}
+        self._national = {window: {} for window in (1, *ROLLING_WINDOWS)}
+        for metric, (positions, matrix) in self._matrix.items():
+            missing = np.isnan(matrix).all(axis=0) if len(matrix) else np.ones(n_periods, dtype=bool)
+            by_uf = np.zeros((len(self.ufs), n_periods))
+            np.add.at(by_uf, self._code_uf[positions], np.nan_to_num(matrix))
+            by_uf[:, missing] = np.nan
+            national = by_uf.sum(axis=0)
+            national[missing] = np.nan
+            for window in self._uf:
+                self._uf[window][metric] = rolling_mean(by_uf, window)
+                self._national[window][metric] = rolling_mean(national, window)
+
+    def municipalities(self, metric):
+        """Códigos IBGE com dado na métrica"""
+        positions, _ = self._matrix[metric]
+        return self.codes[positions].tolist()
+
+    def municipality_label(self, code):
+        uf, name = self.places.get(code, ("?", str(code)))
+        return f"{name} ({uf})"
+
+    def trend(self, metric, uf=None, ibge=None, window=1):
+        """Série mensal da métrica (Brasil, uma UF ou um município), indexada por competência.
+
+        `window` 3 ou 12 devolve a média móvel; Brasil e UF vêm prontos, município é
+        calculado na hora a partir da sua linha.
+        """
+        if ibge is not None:
+            positions, matrix = self._matrix[metric]
+            row = np.searchsorted(self.codes[positions], ibge)
+            if row >= len(positions) or self.codes[positions][row] != ibge:
+                raise KeyError(f"Município {ibge} sem dados para {metric.label}")
+            values = rolling_mean(matrix[row], window)
+        elif uf is not None:
+            values = self._rollup(self._uf, window, metric)[self.ufs.index(uf)]
+        else:
+            values = self._rollup(self._national, window, metric)
+        return pd.Series(values, index=pd.Index(self.periods, name="competência"), name=metric.column)
+
+    def _rollup(self, table, window, metric):
+        if window in table:
+            return table[window][metric]
+        return rolling_mean(table[1][metric], window)  # janela fora das pré-calculadas
+
+
+class TimeSeriesCache:
+    """TimeSeries do catálogo atual; cada relatório é lido uma vez por versão"""
+
+    def __init__(self):
+        self._extracts = {}  # (path, versão) -> extract_report
+        self._current = (None, None)  # (assinatura do catálogo, TimeSeries)
+        self._lock = threading.Lock()
+
+    def get(self, reports):
+        # Um relatório por competência: se houver mais de um, vale o mais recente no catálogo
+        by_period = {}
+        for report in sorted(reports, key=lambda r: r.version[0]):
+            if report.period:
+                by_period[report.period] = report
+        chosen = [by_period[period] for period in sorted(by_period)]
+        signature = tuple((r.path, r.version) for r in chosen)
+        with self._lock:
+            if self._current[0] == signature:
+                return self._current[1]
+            extracts = []
+            for report in chosen:
+                key = (report.path, report.version)
+                if key not in self._extracts:
+                    self._extracts[key] = extract_report(report)
+                extracts.append((report.period, self._extracts[key]))
+            # Esquece versões que saíram do catálogo
+            self._extracts = {key: self._extracts[key] for key in signature}
+            series = TimeSeries(extracts)
+            self._current = (signature, series)
+            return series
+
+
+@singleton
+def get_timeseries_cache():
+    return TimeSeriesCache()
+
+
+def load_timeseries(reports):
+    """Séries do catálogo `reports` (core.catalog.list_reports); refeitas só quando ele muda"""
+    return get_timeseries_cache().get(reports)
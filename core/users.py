@@ -0,0 +1,245 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from core.pool import db_connection
+from core.hashing import encode_record, make_password
+
+
+PAGE_SIZE = 50
+PAGE_SIZES = [25, 50, 100, 200]
+USER_COLUMNS = ["id", "created_at", "cpf", "nome", "sobrenome", "cidade", "admin", "acesso_liberado"]
+PROFILE_COLUMNS = ["cpf", "nome", "sobrenome", "cidade", "admin", "acesso_liberado"]
+REGISTER_COLUMNS = ("nome", "sobrenome", "cidade", "admin", "acesso_liberado")
+USERS_CACHE_TTL = 60  # segundos; limita o atraso quando outro processo altera a tabela
+SESSION_TTL = 300  # segundos até o perfil da sessão (core.auth) ser conferido de novo no banco
+MIN_SEARCH_CHARS = 2  # termos menores não filtram (nem geram consulta)
+TRGM_MIN_CHARS = 3  # o pg_trgm só usa o índice para "contém" com termos a partir daqui
+
+
+# Mesmo mapa da coluna gerada nome_busca/sobrenome_busca (migração 7)
+ACENTOS = "áàâãäéèêëíìîïóòôõöúùûüçñ"
+SEM_ACENTOS = "aaaaaeeeeiiiiooooouuuucn"
+_FOLD = str.maketrans(ACENTOS, SEM_ACENTOS)
+_CPF_TERM = re.compile(r"[\d.\-]*\d[\d.\-]*")  # só dígitos, com ou sem a máscara do CPF
+TRGM_INDEX = "users_nome_busca_trgm_idx"
+
+
+_version_lock = threading.Lock()
+_users_version = 0
+_changed_at = OrderedDict()  # cpf -> (versão, instante) da última alteração, da mais antiga à mais nova
+_all_changed_at = 0  # versão da última alteração sem CPF conhecido
+
+
+def users_version():
+    """Contador que muda a cada alteração na tabela users feita por este processo"""
+    return _users_version
+
+
+def users_changed(cpfs=None):
+    """Invalida o que foi cacheado da lista de usuários; chamar depois do commit de toda alteração.
+
+    `cpfs` são os usuários alterados (None: qualquer um pode ter mudado).
+    """
+    global _users_version, _all_changed_at
+    now = time.monotonic()
+    with _version_lock:
+        _users_version += 1
+        if cpfs is None:
+            _all_changed_at = _users_version
+        else:
+            for cpf in cpfs:
+                _changed_at.pop(cpf, None)
+                _changed_at[cpf] = (_users_version, now)
+        # Perfis lidos antes de uma marca tão velha já venceram pelo SESSION_TTL (o dobro dá
+        # folga para uma leitura em andamento): a marca não serve mais a ninguém
+        while _changed_at and now - next(iter(_changed_at.values()))[1] > 2 * SESSION_TTL:
+            _changed_at.popitem(last=False)
+
+
+def changed_since(cpf, version):
+    """Se o usuário foi alterado (por este processo) depois da versão informada"""
+    mark = _changed_at.get(cpf)
+    return max(_all_changed_at, mark[0] if mark else 0) > version
+
+
+def normalize_search(term):
+    """Termo como está nas colunas de busca: sem espaços nas pontas, minúsculo e sem acento"""
+    return (term or "").strip().lower().translate(_FOLD)
+
+
+def canonical_search(term):
+    """Forma única do termo digitado, usada na consulta e na chave do cache.
+
+    Espaços repetidos, maiúsculas, acentos e a máscara do CPF não mudam o resultado;
+    termos curtos demais valem como busca vazia.
+    """
+    term = " ".join((term or "").split())
+    if _CPF_TERM.fullmatch(term):
+        term = re.sub(r"\D", "", term)
+    else:
+        term = normalize_search(term)
+    return term if len(term) >= MIN_SEARCH_CHARS else ""
+
+
+def _like_literal(term):
+    # % e _ digitados pelo usuário não são curinga
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@lru_cache(maxsize=1)
+def has_trigram_index():
+    """Se a migração 8 conseguiu criar os índices de trigrama (depende do pg_trgm no servidor)"""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_indexes WHERE tablename = 'users' AND indexname = %s", (TRGM_INDEX,))
+        return cur.fetchone() is not None
+
+
+def _search_clause(search_term):
+    """Predicado de busca que os índices da migração 7/8 conseguem atender"""
+    if _CPF_TERM.fullmatch(search_term):
+        # CPF: busca por prefixo, atendida pelo índice varchar_pattern_ops
+        digits = re.sub(r"\D", "", search_term)
+        return "cpf LIKE %s", [f"{digits}%"]
+    term = normalize_search(search_term)
+    # Com pg_trgm o índice GIN atende "contém" (de TRGM_MIN_CHARS em diante); termos mais
+    # curtos, ou sem a extensão, buscam só pelo prefixo, atendido pelo índice btree
+    contains = len(term) >= TRGM_MIN_CHARS and has_trigram_index()
+    term = _like_literal(term)
+    pattern = f"%{term}%" if contains else f"{term}%"
+    return "(nome_busca LIKE %s OR sobrenome_busca LIKE %s)", [pattern, pattern]
+
+
+def _filters(search_term, filter_access, filter_admin):
+    """Cláusulas WHERE e parâmetros dos filtros do painel de administração"""
+    clauses = []
+    params = []
+
+    # Aplica filtro de busca
+    search_term = canonical_search(search_term)
+    if search_term:
+        clause, search_params = _search_clause(search_term)
+        clauses.append(clause)
+        params.extend(search_params)
+
+    # Aplica filtro de acesso
+    if filter_access == "Liberados":
+        clauses.append("acesso_liberado = TRUE")
+    elif filter_access == "Bloqueados":
+        clauses.append("acesso_liberado = FALSE")
+
+    # Aplica filtro de admin
+    if filter_admin == "Administradores":
+        clauses.append("admin = TRUE")
+    elif filter_admin == "Usuários Comuns":
+        clauses.append("admin = FALSE")
+
+    return clauses, params
+
+
+def page_query(search_term, filter_access, filter_admin, after=None, page_size=PAGE_SIZE):
+    """SQL (e parâmetros) da página e da contagem; separado para poder ser inspecionado com EXPLAIN"""
+    clauses, params = _filters(search_term, filter_access, filter_admin)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    page_clauses = clauses + ["(created_at, id) < (%s, %s)"] if after else clauses
+    page_where = " WHERE " + " AND ".join(page_clauses) if page_clauses else ""
+    page_params = params + list(after) if after else params
+    # Uma linha a mais diz se existe próxima página sem precisar de OFFSET
+    page = (
+        f"SELECT {', '.join(USER_COLUMNS)} FROM users{page_where} "
+        "ORDER BY created_at DESC, id DESC LIMIT %s",
+        page_params + [page_size + 1]
+    )
+    count = (f"SELECT COUNT(*) FROM users{where}", params)
+    return page, count
+
+
+def fetch_users_page(search_term, filter_access, filter_admin, after=None, page_size=PAGE_SIZE):
+    """Uma página de usuários em ordem de cadastro (mais recentes primeiro).
+
+    `after` é o cursor (created_at, id) da última linha da página anterior. Retorna
+    (linhas, total, cursor_da_próxima_página ou None).
+    """
+    page, count = page_query(search_term, filter_access, filter_admin, after, page_size)
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(*page)
+        rows = cur.fetchall()
+        cur.execute(*count)
+        total = cur.fetchone()[0]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = (last[1], last[0])
+    return rows, total, next_cursor
+
+
+def fetch_profile(cpf):
+    """Colunas de PROFILE_COLUMNS de um usuário, ou None se o CPF não existe"""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM users WHERE cpf = %s", (cpf,))
+        return cur.fetchone()
+
+
+def register_user(cpf, password, **profile):
+    """Cadastra o usuário numa única ida ao banco.
+
+    `profile` são colunas de REGISTER_COLUMNS; as omitidas ficam com o default da tabela.
+    Retorna o id do novo usuário, ou None se o CPF já estava cadastrado.
+    """
+    unknown = set(profile) - set(REGISTER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Colunas de cadastro desconhecidas: {', '.join(sorted(unknown))}")
+    # Hash antes de retirar a conexão: ela não fica presa no pool esperando o worker
+    record = make_password(password)
+    columns = ["cpf", "password_hash", "salt", "password_record", *profile]
+    with db_connection() as conn, conn.cursor() as cur:
+        # A restrição UNIQUE decide quem fica com o CPF, mesmo com cadastros simultâneos
+        cur.execute(
+            f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            "ON CONFLICT (cpf) DO NOTHING RETURNING id",
+            [cpf, record.digest, record.salt, encode_record(record), *profile.values()]
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    users_changed([cpf])
+    return row[0]
+
+
+def set_access(cpf, acesso_liberado):
+    """Libera ou bloqueia o acesso de um usuário"""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET acesso_liberado = %s WHERE cpf = %s", (acesso_liberado, cpf))
+        updated = cur.rowcount > 0
+    users_changed([cpf])
+    return updated
+
+
+# Ação em lote -> comando; cada um atualiza todos os CPFs de uma vez
+BULK_ACTIONS = {
+    "Liberar acesso": "UPDATE users SET acesso_liberado = TRUE WHERE cpf = ANY(%s) RETURNING cpf",
+    "Bloquear acesso": "UPDATE users SET acesso_liberado = FALSE WHERE cpf = ANY(%s) RETURNING cpf",
+    "Promover a admin": "UPDATE users SET admin = TRUE WHERE cpf = ANY(%s) RETURNING cpf",
+}
+
+
+def apply_bulk_changes(changes):
+    """Aplica as alterações pendentes numa única transação: um UPDATE por ação.
+
+    `changes` é ação -> lista de CPFs. Retorna [(cpf, ação, aplicado)]; aplicado é False
+    quando o CPF não existe mais. Se algo falhar, nada é gravado e a exceção sobe.
+    """
+    results = []
+    with db_connection() as conn, conn.cursor() as cur:
+        for action, cpfs in changes.items():
+            if not cpfs:
+                continue
+            cur.execute(BULK_ACTIONS[action], (list(cpfs),))
+            updated = {row[0] for row in cur.fetchall()}
+            results.extend((cpf, action, cpf in updated) for cpf in cpfs)
+    users_changed([cpf for cpf, _, _ in results])
+    return results
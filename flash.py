@@ -0,0 +1,22 @@
+import streamlit as st
+
+
+FLASH_KEY = "flash_messages"
+
+
+def flash(message, kind="success"):
+    """Guarda uma mensagem para ser mostrada na próxima página exibida nesta sessão"""
+    st.session_state.setdefault(FLASH_KEY, []).append((kind, message))
+
+
+def redirect(page, message=None, kind="success"):
+    """Vai direto para `page`; a mensagem aparece lá, sem segurar a thread com sleep()"""
+    if message:
+        flash(message, kind)
+    st.switch_page(page)
+
+
+def show_flashes():
+    """Mostra (uma única vez) as mensagens deixadas pela página anterior"""
+    for kind, message in st.session_state.pop(FLASH_KEY, []):
+        getattr(st, kind)(message)
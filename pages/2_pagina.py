@@ -1,49 +1,94 @@
+import os
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from io import BytesIO
-from time import sleep
+from functools import partial
+from core.catalog import get_ingester, list_reports
+from core.engine import get_engine
+from core.exports import csv_bytes, excel_bytes
+from core.filters import Filters
+from core.sheets import load_ingested
+from core.timeseries import load_timeseries
+from flash import redirect, show_flashes
+from user_session import current_user, end_session
 
 
 
 # --- CONSTANTES E CONFIGURAÇÕES ---
-COLUNAS_METRICAS = {
-    'valor': [
-        'valor efetivo de repasse', 'implantação', 'componente fixo esf',
-        'vínculo e acompanhamento territorial esf', 'qualidade esf',
-        'valor custeio emulti', 'valor componente qualidade',
-        'valor custeio esb 40h', 'ceo municipal', 'lrpd municipal',
-        'valor', 'total', 'valor eapp municipal'
-    ],
-    'credenciadas': [
-        'qtde. esf credenciadas', 'qtde. emulti credenciadas',
-        'qtde. eap credenciadas', 'qtde. esb ch diferenciada credenciada',
-        'qt. uom credenciada', 'qtde. ecr credenciadas',
-        'qtde. esfrb credenciado', 'qt. acs credenciado',
-        'qtde. ubsf credenciado', 'qtde. microscopista credenciado',
-        'qtde. eapp municipal credenciada'
-    ],
-    'incompletas': [
-        'qtde. esf incompletas - 75%',
-        'qtde. esf incompletas - 50%',
-        'qtde. esf incompletas - 25%'
-    ]
-}
+CATALOG_POLL = 5  # segundos entre conferências do catálogo enquanto há relatórios em conversão
 
-if 'logged_in' not in st.session_state or not st.session_state.logged_in:
-    st.warning("⚠️ Você precisa fazer login primeiro")
-    st.switch_page("pages/Login.py")
-    st.stop()
+# Perfil carregado no login; só volta ao banco quando vence ou é alterado
+user = current_user()
+if user is None:
+    redirect("pages/login.py", "⚠️ Você precisa fazer login primeiro", "warning")
 # --- FUNÇÕES AUXILIARES ---
-@st.cache_data
-def load_data():
+def load_data(path, version, sheet):
+    """Carrega só a planilha pedida, na primeira vez que ela é selecionada"""
+    # Lê direto do cache colunar publicado pelo ingestor (core.catalog); esquema e
+    # totais são preparados uma vez por versão e as reexecuções só leem o resultado.
     try:
-        with pd.ExcelFile("documentos/download.xlsx") as xls:
-            return {sheet: xls.parse(sheet) for sheet in xls.sheet_names}
+        return load_ingested(path, version, sheet)
     except Exception as e:
-        st.error(f"Erro ao carregar o arquivo: {str(e)}")
+        st.error(f"Erro ao carregar a planilha: {str(e)}")
         st.stop()
 
+@st.cache_data(max_entries=64)
+def chart_data(path, version, sheet, chart_type, x_axis, filters=Filters()):
+    """Dados já agregados do gráfico, em cache por (relatório, versão, planilha, tipo, eixo, filtro)"""
+    data = load_data(path, version, sheet)
+    return get_engine().chart_data((path, version, sheet), data, chart_type, x_axis,
+                                   data.schema['valor'][0], filters)
+
+@st.cache_data(max_entries=8)
+def export_file(path, version, sheet, export_format, filters=Filters()):
+    """Arquivo de exportação, gerado só quando alguém clica em baixar e reaproveitado depois"""
+    df = get_engine().frame((path, version, sheet), load_data(path, version, sheet), filters)
+    if export_format == "CSV":
+        return csv_bytes(df)
+    return excel_bytes(df, sheet)
+
+@st.fragment(run_every=CATALOG_POLL)
+def watch_catalog(ingester, shown):
+    """Enquanto o ingestor trabalha, mostra o que está em conversão e recarrega a página
+    quando um relatório fica pronto ou quando ele termina"""
+    if not ingester.busy or [(r.path, r.version) for r in list_reports(ingester.folder)] != shown:
+        st.rerun()
+    if ingester.current:
+        st.caption(f"⏳ Processando em segundo plano: {os.path.basename(ingester.current)}")
+
+def keep_options(key, options):
+    """Tira da seleção guardada o que não existe mais nas opções (outra planilha, outra UF)"""
+    if key in st.session_state:
+        st.session_state[key] = [value for value in st.session_state[key] if value in options]
+
+def sidebar_filters(index, key_prefix):
+    """Filtros da barra lateral: UF, município (das UFs escolhidas) e faixa de valor"""
+    ufs = municipios = ()
+    ranges = []
+    st.markdown("#### **Filtros**")
+    if index.ufs:
+        keep_options("filtro_uf", index.ufs)
+        ufs = tuple(st.multiselect("UF", index.ufs, key="filtro_uf", placeholder="Todas"))
+    if index.municipios:
+        options = index.municipios_of(ufs)
+        keep_options("filtro_municipio", options)
+        municipios = tuple(st.multiselect(
+            "Município", options, key="filtro_municipio", placeholder="Todos",
+            format_func=lambda place: f"{place[1]} ({place[0]})" if place[0] else place[1],
+        ))
+    value_columns = [col for col in index.schema['valor'] if index.bounds(col)]
+    if value_columns:
+        column = st.selectbox("Faixa de valor", [None] + value_columns,
+                              format_func=lambda col: "Sem faixa" if col is None else col)
+        if column is not None:
+            low, high = index.bounds(column)
+            if low < high:
+                # Chave por planilha e coluna: os limites mudam de uma para outra
+                selected = st.slider(column, low, high, (low, high), key=f"{key_prefix}:{column}",
+                                     label_visibility="collapsed")
+                if selected != (low, high):
+                    ranges.append((column, *selected))
+    return Filters(ufs, municipios, tuple(ranges))
+
 def create_metric_box(col, title, value, color="#03FF25", border_color="#ddd"):
     col.markdown(
         f"""
@@ -59,6 +104,7 @@ def create_metric_box(col, title, value, color="#03FF25", border_color="#ddd"):
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(layout="wide", page_title="Dashboard Financeiro de Saúde")
 st.title("📊 Atenção Primária à Saúde Relatório de Pagamento")
+show_flashes()
 
 # Esconder navegação padrão
 st.markdown("""
@@ -72,12 +118,14 @@ st.markdown("""
 # --- SIDEBAR ---
 with st.sidebar:
     st.markdown("#### **Menu Principal**")
+    # Preenchido depois que a planilha é escolhida
+    filter_box = st.container()
     
     # Botão de Logout com cor vermelha e ícone
     for _ in range(39):  # Ajuste o número de linhas vazias
         st.write("")
     
-    if st.session_state.get('is_admin'):
+    if user.admin:
     # Mostrar funcionalidades exclusivas para admin
         if st.button(
             "Admin",
@@ -85,21 +133,16 @@ with st.sidebar:
             help="Clique para acessar a página de administração",
             use_container_width=True,
             ):
-            st.session_state.logged_in = True
-            st.session_state.is_admin = True
             st.switch_page("pages/pagina_admin.py")
     if st.button("Logout",
                  use_container_width=True,
                 help="Clique para sair do sistema",
                 type="primary",
                  ):
-        st.session_state.logged_in = False
-        st.session_state.is_admin = False
-        st.success("Você foi desconectado com sucesso!")
-        sleep(1)
-        st.switch_page("app.py")
+        end_session()
+        redirect("app.py", "Você foi desconectado com sucesso!")
     
-if st.session_state.get('is_admin'):
+if user.admin:
     # Mostrar funcionalidades exclusivas para admin
     st.write("Você tem privilégios de administrador!")
     # Exemplo: botão para adicionar novo admin
@@ -108,9 +151,35 @@ else:
 
 # --- CONTEÚDO PRINCIPAL ---
 st.header("🔍 Análise Detalhada dos Dados")
-sheets = load_data()
-selected_sheet = st.selectbox("Selecione a planilha para análise", list(sheets.keys()))
-df = sheets[selected_sheet].dropna(how='all')
+
+# Catálogo: só manifests já publicados; a conversão de arquivos novos roda em segundo plano
+ingester = get_ingester()
+reports = list_reports(ingester.folder)
+if ingester.busy:
+    watch_catalog(ingester, [(r.path, r.version) for r in reports])
+if user.admin:
+    for failed, (_, message) in list(ingester.errors.items()):
+        st.warning(f"Não foi possível processar {os.path.basename(failed)}: {message}")
+if not reports:
+    if ingester.busy:
+        st.info("Nenhum relatório disponível ainda. Os arquivos da pasta de documentos estão sendo processados.")
+    else:
+        st.info(f"Nenhum relatório encontrado em {ingester.folder}/")
+    st.stop()
+
+report = st.selectbox("Relatório (competência)", reports, format_func=lambda r: r.label)
+selected_sheet = st.selectbox("Selecione a planilha para análise", report.sheet_names)
+path, version = report.path, report.version
+sheet = load_data(path, version, selected_sheet)
+with filter_box:
+    filters = sidebar_filters(sheet.index, f"faixa:{path}:{selected_sheet}")
+# Totais e recorte no motor de consultas (core.engine): SQL embutido ou o índice em NumPy
+engine = get_engine()
+schema = sheet.schema
+totals = engine.totals((path, version, selected_sheet), sheet, filters)
+df = engine.frame((path, version, selected_sheet), sheet, filters)
+if filters.active:
+    st.caption(f"Filtro aplicado: {len(df):,} de {len(sheet.df):,} registros")
 
 # --- SEÇÃO DE MÉTRICAS ---
 st.subheader("📊 Métricas Financeiras")
@@ -119,35 +188,32 @@ st.subheader("📊 Métricas Financeiras")
 col1, col2, col3, col4 = st.columns(4)
 
 # Métricas financeiras principais
-value_columns = [col for col in df.columns 
-                if str(col).lower() in [word.lower() for word in COLUNAS_METRICAS['valor']]]
-value_integral = [col for col in df.columns 
-                if str(col).lower() in ['valor integral', 'implantação']]
-if value_integral:
-    col1.metric("Valor Integral", f"R$ {df[value_integral].sum().sum():,.2f}")
-if 'Desconto' in df.columns:
-    col2.metric("Total Descontos", f"R$ {df['Desconto'].sum():,.2f}")
-if value_columns:
-    col3.metric("Valor Repasse", f"R$ {df[value_columns].sum().sum():,.2f}")
-
-col4.metric("Registros", len(df))
+value_columns = schema['valor']
+if totals['valor integral'] is not None:
+    col1.metric("Valor Integral", f"R$ {totals['valor integral']:,.2f}")
+if totals['Desconto'] is not None:
+    col2.metric("Total Descontos", f"R$ {totals['Desconto']:,.2f}")
+if totals['valor'] is not None:
+    col3.metric("Valor Repasse", f"R$ {totals['valor']:,.2f}")
+
+col4.metric("Registros", totals['registros'])
 
 # Linha 2 de métricas
 cols = st.columns(8)
 metric_cols = {
-    'credenciadas': (cols[0], COLUNAS_METRICAS['credenciadas'], "#03FF25"),
-    'com portaria': (cols[1], ['qtde. esf com portaria de homologação'], "#03FF25"),
-    'pagas': (cols[2], ['qtde. esf pagas'], "#03FF25"),
-    'completas': (cols[3], ['qtde. esf completas'], "#03FF25"),
-    'incom 75%': (cols[4], ['qtde. esf incompletas - 75%'], "#FF0000"),
-    'incom 50%': (cols[5], ['qtde. esf incompletas - 50%'], "#FF0000"),
-    'incom 25%': (cols[6], ['qtde. esf incompletas - 25%'], "#FF0000")
+    'credenciadas': (cols[0], "#03FF25"),
+    'com portaria': (cols[1], "#03FF25"),
+    'pagas': (cols[2], "#03FF25"),
+    'completas': (cols[3], "#03FF25"),
+    'incom 75%': (cols[4], "#FF0000"),
+    'incom 50%': (cols[5], "#FF0000"),
+    'incom 25%': (cols[6], "#FF0000")
 }
 
-for name, (col, terms, color) in metric_cols.items():
-    matching_cols = [c for c in df.columns if any(t in str(c).lower() for t in terms)]
-    if matching_cols:
-        total = df[matching_cols].sum().sum()
+for name, (col, color) in metric_cols.items():
+    matching_cols = schema[name]
+    if matching_cols and totals[name] is not None:
+        total = totals[name]
         title = matching_cols[0] if name not in ['incom 75%', 'incom 50%', 'incom 25%'] else name.replace('incom', 'Incompletas')
         create_metric_box(col, title, total, color)
     else:
@@ -156,7 +222,7 @@ for name, (col, terms, color) in metric_cols.items():
 # --- VISUALIZAÇÃO DOS DADOS ---
 st.subheader("📈 Visualização dos Dados")
 
-tab1, tab2 = st.tabs(["Tabela", "Gráficos"])
+tab1, tab2, tab3 = st.tabs(["Tabela", "Gráficos", "Tendências"])
 
 with tab1:
     st.dataframe(df, height=400, use_container_width=True)
@@ -164,41 +230,73 @@ with tab1:
 with tab2:
     if value_columns:
         chart_type = st.selectbox("Tipo de gráfico", ["Barras", "Pizza", "Linhas"])
-        x_axis = st.selectbox("Eixo X", [col for col in df.columns if col not in value_columns])
+        value_set = set(value_columns)
+        x_axis = st.selectbox("Eixo X", [col for col in df.columns if col not in value_set])
+        
+        # O navegador recebe só a agregação (tamanho limitado), nunca as linhas cruas
+        plot_df = chart_data(path, version, selected_sheet, chart_type, x_axis, filters)
+        color = 'UF' if 'UF' in plot_df.columns and x_axis != 'UF' else None
         
         if chart_type == "Barras":
-            fig = px.bar(df, x=x_axis, y=value_columns[0], 
-                        color='UF' if 'UF' in df.columns else None,
+            fig = px.bar(plot_df, x=x_axis, y=value_columns[0], 
+                        color=color,
                         template="plotly_white")
         elif chart_type == "Pizza":
-            fig = px.pie(df, names=x_axis, values=value_columns[0],
+            fig = px.pie(plot_df, names=x_axis, values=value_columns[0],
                         hole=0.3)
         else:
-            fig = px.line(df, x=x_axis, y=value_columns[0],
-                        color='UF' if 'UF' in df.columns else None)
+            fig = px.line(plot_df, x=x_axis, y=value_columns[0],
+                        color=color)
         
         fig.update_layout(margin=dict(l=20, r=20, t=30, b=20))
         st.plotly_chart(fig, use_container_width=True)
 
+with tab3:
+    # Séries de todas as competências catalogadas, montadas uma vez por versão do catálogo
+    try:
+        series = load_timeseries(reports)
+    except LookupError as e:
+        # Um relatório foi reprocessado depois que esta execução leu o catálogo
+        st.info(str(e))
+    except Exception as e:
+        st.error(f"Erro ao carregar as tendências: {str(e)}")
+    else:
+        if not series.metrics:
+            st.info("Nenhuma competência reconhecida nos relatórios catalogados.")
+        else:
+            if len(series.periods) == 1:
+                st.caption("Só há uma competência no catálogo; a tendência aparece a partir da segunda.")
+            metric = st.selectbox("Métrica", series.metrics, format_func=lambda m: m.label)
+            scope = st.radio("Abrangência", ["Brasil", "UF", "Município"], horizontal=True)
+            uf = ibge = None
+            if scope == "UF":
+                uf = st.selectbox("UF", series.ufs)
+            elif scope == "Município":
+                ibge = st.selectbox("Município", series.municipalities(metric),
+                                    format_func=series.municipality_label)
+            window = st.radio("Período", [1, 3, 12], horizontal=True,
+                              format_func=lambda w: "Mensal" if w == 1 else f"Média móvel de {w} meses")
+            trend = series.trend(metric, uf=uf, ibge=ibge, window=window).reset_index()
+            fig = px.line(trend, x="competência", y=metric.column, markers=True)
+            fig.update_layout(margin=dict(l=20, r=20, t=30, b=20))
+            st.plotly_chart(fig, use_container_width=True)
+
 # --- EXPORTAÇÃO DE DADOS ---
 st.subheader("💾 Exportar Dados")
 export_format = st.radio("Formato", ["CSV", "Excel"], horizontal=True, label_visibility="collapsed")
 
+# O conteúdo é uma função: só roda no clique, em outra thread, sem segurar o rerun
 if export_format == "CSV":
     st.download_button(
         "Baixar CSV",
-        df.to_csv(index=False).encode('utf-8'),
-        f"{selected_sheet}.csv",
+        partial(export_file, path, version, selected_sheet, "CSV", filters),
+        f"{os.path.splitext(report.source)[0]}_{selected_sheet}.csv",
         "text/csv"
     )
 else:
-    excel_buffer = BytesIO()
-    with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name=selected_sheet)
     st.download_button(
         "Baixar Excel",
-        excel_buffer.getvalue(),
-        f"{selected_sheet}.xlsx",
+        partial(export_file, path, version, selected_sheet, "Excel", filters),
+        f"{os.path.splitext(report.source)[0]}_{selected_sheet}.xlsx",
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
-    
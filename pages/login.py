@@ -1,11 +1,12 @@
 import streamlit as st
-import psycopg2
-import hashlib
-import os
-import re
-from datetime import datetime
-from time import sleep
-from psycopg2 import sql, extras
+from core.auth import (
+    LOGIN_BLOCKED, LOGIN_OK, authenticate, is_valid_cpf, set_password, user_exists
+)
+from core.migrations import ensure_schema
+from core.throttle import TOO_MANY_ATTEMPTS, check_attempt
+from core.users import register_user
+from flash import redirect, show_flashes
+from user_session import current_user, session_key, start_session
 
 
 # Configuração inicial
@@ -23,169 +24,16 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Configurações do PostgreSQL na nuvem
-DB_CONFIG = {
-    'host': st.secrets["db"]["host"],
-    'database': st.secrets["db"]["database"],
-    'user': st.secrets["db"]["user"],
-    'password': st.secrets["db"]["password"],
-    'port': st.secrets["db"]["port"],
-    'sslmode': 'require'
-}
-
-
-# Funções do banco de dados
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        st.error(f"Erro ao conectar ao banco de dados: {str(e)}")
-        return None  # explícito, para evitar erro de cursor
-
-def init_db():
-    """Garante que a tabela existe com todas as colunas necessárias"""
-    try:
-        conn = get_db_connection()
-        if conn is None:
-            st.error("Falha ao conectar ao banco de dados")
-            return None
-
-        with conn.cursor() as cur:
-            # Verifica se a tabela existe
-            cur.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'users'
-            );
-            """)
-            exists = cur.fetchone()[0]
-
-            if not exists:
-                cur.execute("""
-                CREATE TABLE users (
-                    id SERIAL PRIMARY KEY,
-                    nome VARCHAR(100) NOT NULL,
-                    sobrenome VARCHAR(100) NOT NULL,
-                    cpf VARCHAR(11) UNIQUE NOT NULL,
-                    cidade VARCHAR(100) NOT NULL,
-                    password_hash BYTEA NOT NULL,
-                    salt BYTEA NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    admin BOOLEAN DEFAULT FALSE,
-                    acesso_liberado BOOLEAN DEFAULT TRUE  -- Nova coluna
-                )
-                """)
-                conn.commit()
-            else:
-                # Verifica e adiciona colunas faltantes
-                columns_to_check = ['acesso_liberado', 'nome', 'sobrenome', 'cidade', 'admin']
-                
-                for column in columns_to_check:
-                    cur.execute("""
-                    SELECT column_name 
-                    FROM information_schema.columns 
-                    WHERE table_name='users' AND column_name=%s
-                    """, (column,))
-                    if not cur.fetchone():
-                        if column == 'acesso_liberado':
-                            cur.execute("ALTER TABLE users ADD COLUMN acesso_liberado BOOLEAN DEFAULT TRUE")
-                        elif column == 'nome':
-                            cur.execute("ALTER TABLE users ADD COLUMN nome VARCHAR(100) NOT NULL DEFAULT 'Nome não informado'")
-                        # ... (similar para outras colunas)
-                        conn.commit()
-
-        return conn
-    except Exception as e:
-        st.error(f"Erro ao inicializar banco de dados: {str(e)}")
-        if conn:
-            conn.close()
-        return None
-    
-def is_user_admin(cpf):
-    """Verifica se o usuário tem privilégios de admin"""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT admin FROM users WHERE cpf = %s", (cpf,))
-            result = cur.fetchone()
-            return result[0] if result else False
-    except Exception as e:
-        st.error(f"Erro ao verificar privilégios de admin: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-
-def hash_password(password, salt=None):
-    if salt is None:
-        salt = os.urandom(32)
-    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000), salt
-
-
-def verify_user(cpf, password):
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-            SELECT password_hash, salt, nome, sobrenome, cidade, admin, acesso_liberado 
-            FROM users WHERE cpf = %s
-            """, (cpf,))
-            result = cur.fetchone()
-            
-            if result:
-                stored_hash, salt, nome, sobrenome, cidade, admin, acesso_liberado = result
-                
-                if not acesso_liberado:
-                    st.error("Seu acesso não está liberado. Entre em contato com o administrador.")
-                    return False
-                
-                stored_hash = bytes(stored_hash)
-                salt = bytes(salt)
-                new_hash, _ = hash_password(password, salt)
-                
-                if new_hash == stored_hash:
-                    st.session_state.nome = nome
-                    st.session_state.sobrenome = sobrenome
-                    st.session_state.cidade = cidade
-                    st.session_state.is_admin = admin
-                    return True
-            return False
-    finally:
-        conn.close()
-
-
-def is_valid_cpf(cpf):
-    """Valida formato do CPF"""
-    return re.fullmatch(r'\d{11}', cpf) is not None
-
-def promote_to_admin(cpf):
-    """Promove um usuário a admin"""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    try:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE users SET admin = TRUE WHERE cpf = %s", (cpf,))
-            conn.commit()
-            return cur.rowcount > 0
-    except Exception as e:
-        st.error(f"Erro ao promover usuário: {str(e)}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
+# Estrutura do banco: as migrações rodam uma vez por processo, não a cada cadastro
+try:
+    ensure_schema()
+except Exception as e:
+    st.error(f"Erro ao inicializar banco de dados: {str(e)}")
 
 # Interface de Login (mantida igual, apenas atualizei as queries)
 st.markdown("## 🔒 Bem Vindo ao Sistema")
 st.markdown("*Por favor, faça login ou registre-se para continuar*")
+show_flashes()
 
 tab_login, tab_register, tab_recover = st.tabs(["Login", "Cadastro", "Recuperar Senha"])
 
@@ -198,14 +46,22 @@ with tab_login:
         if submit_login:
             if not is_valid_cpf(cpf):
                 st.error("CPF inválido. Deve conter exatamente 11 dígitos numéricos.")
-            elif verify_user(cpf, password):
-                st.session_state.logged_in = True
-                st.session_state.cpf = cpf
-                st.success(f"Bem-vindo, {st.session_state.nome}!")
-                sleep(1)
-                st.switch_page("pages/2_pagina.py")
+            elif check_attempt(session_key(), cpf):
+                # Recusada antes de consultar o banco ou calcular o hash
+                st.error(TOO_MANY_ATTEMPTS)
             else:
-                st.error("CPF ou senha inválidos")
+                try:
+                    status, user = authenticate(cpf, password)
+                except Exception as e:
+                    st.error(f"Erro ao conectar ao banco de dados: {str(e)}")
+                    status, user = None, None
+                if status == LOGIN_OK:
+                    start_session(user)
+                    redirect("pages/2_pagina.py", f"Bem-vindo, {user.nome}!")
+                elif status == LOGIN_BLOCKED:
+                    st.error("Seu acesso não está liberado. Entre em contato com o administrador.")
+                else:
+                    st.error("CPF ou senha inválidos")
 
 with tab_register:
     with st.form("register_form"):
@@ -222,7 +78,8 @@ with tab_register:
         
         # Se for admin, pode cadastrar outros admins
         is_admin = False
-        if st.session_state.get('is_admin'):
+        logged_user = current_user()
+        if logged_user is not None and logged_user.admin:
             is_admin = st.checkbox("Usuário é administrador?", key="admin_check")
         
         submit_register = st.form_submit_button("Cadastrar")
@@ -236,37 +93,28 @@ with tab_register:
                 st.error("As senhas não coincidem!")
             elif len(new_pass) < 6:
                 st.error("A senha deve ter pelo menos 6 caracteres")
+            elif check_attempt(session_key()):
+                # Cadastro também calcula hash: limitado por sessão
+                st.error(TOO_MANY_ATTEMPTS)
             else:
-                conn = init_db()
-                if conn is None:
-                    st.error("Não foi possível estabelecer conexão com o banco de dados")
-                else:
-                    try:
-                        with conn.cursor() as cur:
-                            # Verifica se CPF já existe
-                            cur.execute("SELECT cpf FROM users WHERE cpf = %s", (new_cpf,))
-                            if cur.fetchone():
-                                st.error("Este CPF já está cadastrado")
-                            else:
-                                password_hash, salt = hash_password(new_pass)
-                                # No formulário de cadastro (tab_register), após a inserção do usuário:
-                                cur.execute(
-                                    """INSERT INTO users 
-                                    (nome, sobrenome, cpf, cidade, password_hash, salt, admin, acesso_liberado) 
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-                                    (nome, sobrenome, new_cpf, cidade, password_hash, salt, is_admin, False)  # Novo usuário tem acesso liberado por padrão
-                                )
-                                
-                                conn.commit()
-                                st.success("Cadastro realizado com sucesso!")
-                                sleep(1.5)
-                                st.switch_page("app.py")
-                    except Exception as e:
-                        st.error(f"Erro durante o cadastro: {str(e)}")
-                        conn.rollback()
-                    finally:
-                        if conn:
-                            conn.close()
+                registered = False
+                try:
+                    # Um único INSERT; CPF repetido volta como None em vez de erro
+                    registered = register_user(
+                        new_cpf, new_pass,
+                        nome=nome, sobrenome=sobrenome, cidade=cidade,
+                        admin=is_admin,
+                        acesso_liberado=False  # novo usuário aguarda liberação do administrador
+                    ) is not None
+                    if not registered:
+                        st.error("Este CPF já está cadastrado")
+                except Exception as e:
+                    st.error(f"Erro durante o cadastro: {str(e)}")
+                    registered = False
+
+                # Só redireciona depois que o commit saiu do bloco da conexão
+                if registered:
+                    redirect("app.py", "Cadastro realizado com sucesso!")
 with tab_recover:
     # Primeiro formulário para verificar o CPF
     with st.form("recover_form"):
@@ -276,17 +124,14 @@ with tab_recover:
         if submit_recover:
             if not is_valid_cpf(recovery_cpf):
                 st.error("CPF inválido. Deve conter exatamente 11 dígitos numéricos.")
+            elif check_attempt(session_key(), recovery_cpf):
+                st.error(TOO_MANY_ATTEMPTS)
             else:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("SELECT cpf FROM users WHERE cpf = %s", (recovery_cpf,))
-                
-                if cur.fetchone():
+                if user_exists(recovery_cpf):
                     st.session_state.reset_cpf = recovery_cpf
                     st.success("CPF verificado. Por favor, defina sua nova senha abaixo.")
                 else:
                     st.error("CPF não cadastrado no sistema")
-                conn.close()
     
     # Formulário SEPARADO para nova senha
     if 'reset_cpf' in st.session_state:
@@ -300,20 +145,20 @@ with tab_recover:
                     st.error("As senhas não coincidem!")
                 elif len(new_password) < 6:
                     st.error("A senha deve ter pelo menos 6 caracteres")
+                elif check_attempt(session_key(), st.session_state.reset_cpf):
+                    # Troca de senha calcula hash: mesmo limite do login e da recuperação
+                    st.error(TOO_MANY_ATTEMPTS)
                 else:
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-                    password_hash, salt = hash_password(new_password)
-                    cur.execute(
-                        "UPDATE users SET password_hash = %s, salt = %s WHERE cpf = %s",
-                        (password_hash, salt, st.session_state.reset_cpf)
-                    )
-                    conn.commit()
-                    st.success("Senha atualizada com sucesso!")
-                    del st.session_state.reset_cpf
-                    conn.close()
-                    sleep(1)
-                    st.switch_page("app.py")
+                    updated = False
+                    try:
+                        set_password(st.session_state.reset_cpf, new_password)
+                        updated = True
+                    except Exception as e:
+                        st.error(f"Erro ao atualizar a senha: {str(e)}")
+
+                    if updated:
+                        del st.session_state.reset_cpf
+                        redirect("app.py", "Senha atualizada com sucesso!")
 
 
 
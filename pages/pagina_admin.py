@@ -1,6 +1,13 @@
 import streamlit as st
-from database import promote_to_admin, get_db_connection
-from time import sleep
+import pandas as pd
+from st_aggrid import AgGrid, GridOptionsBuilder
+from core.throttle import throttle_stats
+from core.users import (
+    BULK_ACTIONS, MIN_SEARCH_CHARS, PAGE_SIZE, PAGE_SIZES, USER_COLUMNS, USERS_CACHE_TTL,
+    apply_bulk_changes, canonical_search, fetch_users_page, users_version
+)
+from flash import redirect, show_flashes
+from user_session import current_user, end_session
 
 # Esconder navegação padrão
 st.markdown("""
@@ -12,28 +19,28 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Verificação mais robusta do estado de login
-if not st.session_state.get('logged_in', False):
-    st.warning("⚠️ Você precisa fazer login primeiro")
-    sleep(1)  # Pequeno delay para visualização da mensagem
-    st.switch_page("pages/Login.py")
-    st.stop()
+user = current_user()
+if user is None:
+    redirect("pages/login.py", "⚠️ Você precisa fazer login primeiro", "warning")
     
 # Verificação específica para admin
-if st.session_state.get('is_admin', False):
+if user.admin:
     st.success("Acesso autorizado: você é um administrador")
 else:
-    st.warning("Acesso negado: você não tem privilégios de administrador")
-    sleep(2)
-    st.switch_page("app.py")
-    st.stop()
+    redirect("pages/2_pagina.py", "Acesso negado: você não tem privilégios de administrador", "warning")
 
 st.title("Painel de Administração Completo")
+show_flashes()
     
 
 # Campo de busca na sidebar
 with st.sidebar:
     st.subheader("Filtrar Usuários")
-    search_term = st.text_input("Buscar por nome, sobrenome ou CPF:", key="search_users")
+    search_term = st.text_input(
+        "Buscar por nome, sobrenome ou CPF:",
+        key="search_users",
+        help=f"A busca começa a partir de {MIN_SEARCH_CHARS} caracteres"
+    )
     
     # Opções de filtro adicionais
     st.markdown("---")
@@ -50,159 +57,170 @@ with st.sidebar:
         key="filter_admin"
     )
 
-# Lista todos os usuários com filtros aplicados
-@st.cache_data
-def list_users(search_term, filter_access, filter_admin):
-    if st.session_state.get('is_admin'):
-    # Conexão com o banco de dados
-        conn = get_db_connection()
-        if conn:
+    page_size = st.selectbox(
+        "Usuários por página:",
+        PAGE_SIZES,
+        index=PAGE_SIZES.index(PAGE_SIZE),
+        key="page_size"
+    )
+
+def describe_staged(entry):
+    """Ações pendentes de um usuário, como aparecem na tela"""
+    actions = []
+    if "acesso" in entry:
+        actions.append("Liberar acesso" if entry["acesso"] else "Bloquear acesso")
+    if entry.get("admin"):
+        actions.append("Promover a admin")
+    return actions
+
+# Lista de usuários: a mesma combinação de filtros não volta ao banco enquanto
+# ninguém alterar a tabela (a versão entra na chave) e o TTL não vencer
+@st.cache_data(ttl=USERS_CACHE_TTL, max_entries=256, show_spinner=False)
+def cached_users_page(version, search_term, filter_access, filter_admin, after, page_size):
+    return fetch_users_page(search_term, filter_access, filter_admin, after=after, page_size=page_size)
+
+if user.admin:
+    # Termo normalizado: espaço a mais, acento ou maiúscula não geram outra consulta
+    search_term = canonical_search(search_term)
+    # Volta para a primeira página sempre que os filtros mudam
+    filter_key = (search_term, filter_access, filter_admin, page_size)
+    if st.session_state.get('admin_filter_key') != filter_key:
+        st.session_state.admin_filter_key = filter_key
+        st.session_state.admin_cursors = [None]  # cursor de início de cada página visitada
+    cursors = st.session_state.admin_cursors
+    # Alterações marcadas e ainda não gravadas: cpf -> {"nome", "acesso"?, "admin"?}
+    staged = st.session_state.setdefault("admin_staged", {})
+
+    users = None
+    try:
+        users, total, next_cursor = cached_users_page(
+            users_version(), search_term, filter_access, filter_admin, cursors[-1], page_size
+        )
+    except Exception as e:
+        st.error(f"Erro ao acessar o banco de dados: {str(e)}")
+
+    # Resultado da última aplicação em lote, linha a linha
+    results = st.session_state.pop("admin_results", None)
+    if results:
+        failed = sum(not ok for _, _, ok in results)
+        if failed:
+            st.warning(f"{len(results) - failed} alteração(ões) aplicada(s), {failed} sem efeito")
+        else:
+            st.success(f"{len(results)} alteração(ões) aplicada(s) com sucesso!")
+        st.dataframe(
+            pd.DataFrame(
+                [(cpf, action, "Aplicado" if ok else "Usuário não encontrado") for cpf, action, ok in results],
+                columns=["CPF", "Ação", "Resultado"]
+            ),
+            hide_index=True, use_container_width=True
+        )
+
+    # Alterações pendentes: todas vão ao banco juntas, numa transação
+    if staged:
+        st.subheader(f"Alterações pendentes: {len(staged)} usuário(s)")
+        st.dataframe(
+            pd.DataFrame(
+                [(cpf, entry["nome"], ", ".join(describe_staged(entry))) for cpf, entry in staged.items()],
+                columns=["CPF", "Nome", "Alteração"]
+            ),
+            hide_index=True, use_container_width=True
+        )
+        col_apply, col_discard = st.columns(2)
+        if col_apply.button("Aplicar alterações", type="primary", use_container_width=True):
+            changes = {action: [] for action in BULK_ACTIONS}
+            for cpf, entry in staged.items():
+                if "acesso" in entry:
+                    changes["Liberar acesso" if entry["acesso"] else "Bloquear acesso"].append(cpf)
+                if entry.get("admin"):
+                    changes["Promover a admin"].append(cpf)
             try:
-                with conn.cursor() as cur:
-                    # Query base
-                    query = """
-                    SELECT cpf, nome, sobrenome, cidade, admin, acesso_liberado 
-                    FROM users 
-                    WHERE 1=1
-                    """
-
-                    params = []
-
-                    # Aplica filtro de busca
-                    if search_term:
-                        query += """
-                        AND (LOWER(nome) LIKE LOWER(%s) 
-                        OR LOWER(sobrenome) LIKE LOWER(%s) 
-                        OR cpf LIKE %s)
-                        """
-                        search_param = f"%{search_term}%"
-                        params.extend([search_param, search_param, search_param])
-
-                    # Aplica filtro de acesso
-                    if filter_access == "Liberados":
-                        query += " AND acesso_liberado = TRUE"
-                    elif filter_access == "Bloqueados":
-                        query += " AND acesso_liberado = FALSE"
-
-                    # Aplica filtro de admin
-                    if filter_admin == "Administradores":
-                        query += " AND admin = TRUE"
-                    elif filter_admin == "Usuários Comuns":
-                        query += " AND admin = FALSE"
-
-                    query += " ORDER BY created_at DESC"
-
-                    cur.execute(query, params)
-                    users = cur.fetchall()
-
-                    return users
+                st.session_state.admin_results = apply_bulk_changes(changes)
             except Exception as e:
-                st.error(f"Erro ao acessar o banco de dados: {str(e)}")
-            finally:
-                conn.close()
-    else:
-        st.error("Acesso negado: apenas administradores podem acessar esta página")
-        st.switch_page("pages/2_pagina.py")
-        st.stop()
-conn = get_db_connection()
-if st.session_state.get('is_admin'):
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                # Query base
-                query = """
-                SELECT cpf, nome, sobrenome, cidade, admin, acesso_liberado 
-                FROM users 
-                WHERE 1=1
-                """
-
-                params = []
-
-                # Aplica filtro de busca
-                if search_term:
-                    query += """
-                    AND (LOWER(nome) LIKE LOWER(%s) 
-                    OR LOWER(sobrenome) LIKE LOWER(%s) 
-                    OR cpf LIKE %s)
-                    """
-                    search_param = f"%{search_term}%"
-                    params.extend([search_param, search_param, search_param])
-
-                # Aplica filtro de acesso
-                if filter_access == "Liberados":
-                    query += " AND acesso_liberado = TRUE"
-                elif filter_access == "Bloqueados":
-                    query += " AND acesso_liberado = FALSE"
-
-                # Aplica filtro de admin
-                if filter_admin == "Administradores":
-                    query += " AND admin = TRUE"
-                elif filter_admin == "Usuários Comuns":
-                    query += " AND admin = FALSE"
-
-                query += " ORDER BY created_at DESC"
-
-                cur.execute(query, params)
-                users = cur.fetchall()
-
-                # Mostra resultados da busca
-                st.subheader(f"Usuários Encontrados: {len(users)}")
-
-                if not users:
-                    st.info("Nenhum usuário encontrado com os filtros aplicados")
-                else:
-                    for cpf, nome, sobrenome, cidade, is_admin, acesso_liberado in users:
-                        with st.expander(f"{nome} {sobrenome} - CPF: {cpf}"):
-                            # Colunas para exibição de informações
-                            col_info1, col_info2, col_info3 = st.columns(3)
-                            with col_info1:
-                                st.write(f"**Cidade:** {cidade}")
-                            with col_info2:
-                                st.write(f"**Status Admin:** {'✅ Sim' if is_admin else '❌ Não'}")
-                            with col_info3:
-                                st.write(f"**Acesso:** {'🔓 Liberado' if acesso_liberado else '🔒 Bloqueado'}")
-
-                            # Linha divisória
-                            st.markdown("---")
-
-                            # Colunas para controles administrativos
-                            col_control1, col_control2 = st.columns(2)
-
-                            with col_control1:
-                                # Controle de acesso
-                                new_access_status = st.checkbox(
-                                    "Liberar acesso ao sistema",
-                                    value=acesso_liberado,
-                                    key=f"access_{cpf}"
-                                )
-
-                                if new_access_status != acesso_liberado:
-                                    cur.execute("""
-                                    UPDATE users SET acesso_liberado = %s WHERE cpf = %s
-                                    """, (new_access_status, cpf))
-                                    conn.commit()
-                                    st.success("Status de acesso atualizado com sucesso!")
-                                    st.rerun()
-
-                            with col_control2:
-                                # Controle de admin
-                                if not is_admin:
-                                    if st.button(f"Promover a Admin", key=f"promote_{cpf}"):
-                                        if promote_to_admin(cpf):
-                                            st.success(f"Usuário {nome} promovido a administrador!")
-                                            st.rerun()
-                                        else:
-                                            st.error("Falha na operação")
-                                else:
-                                    st.write("Usuário já é administrador")
-        except Exception as e:
-            st.error(f"Erro ao acessar o banco de dados: {str(e)}")
-        finally:
-            conn.close()
+                st.error(f"Erro ao aplicar alterações (nada foi gravado): {str(e)}")
+            else:
+                staged.clear()
+                st.rerun()  # uma única reexecução para o lote inteiro
+        if col_discard.button("Descartar", use_container_width=True):
+            staged.clear()
+            st.rerun()
+
+    if users is not None:
+        # Mostra resultados da busca
+        st.subheader(f"Usuários Encontrados: {total}")
+
+        if not users:
+            st.info("Nenhum usuário encontrado com os filtros aplicados")
+        else:
+            table = pd.DataFrame(users, columns=USER_COLUMNS).drop(columns=["id"])
+            table["created_at"] = table["created_at"].dt.strftime("%d/%m/%Y %H:%M")
+            table["pendente"] = [", ".join(describe_staged(staged.get(cpf, {}))) for cpf in table["cpf"]]
+
+            gb = GridOptionsBuilder.from_dataframe(table)
+            gb.configure_default_column(editable=False, resizable=True)
+            gb.configure_column("cpf", header_name="CPF")
+            gb.configure_column("nome", header_name="Nome")
+            gb.configure_column("sobrenome", header_name="Sobrenome")
+            gb.configure_column("cidade", header_name="Cidade")
+            gb.configure_column("created_at", header_name="Cadastro")
+            gb.configure_column("admin", header_name="Admin")
+            gb.configure_column("acesso_liberado", header_name="Acesso liberado")
+            gb.configure_column("pendente", header_name="Alteração pendente")
+            gb.configure_selection("multiple", use_checkbox=True, header_checkbox=True)
+            grid = AgGrid(
+                table,
+                gridOptions=gb.build(),
+                height=min(60 + 35 * len(table), 600),
+                update_on=["selectionChanged"],
+                key=f"users_grid_{hash(filter_key)}_{len(cursors)}_{users_version()}",
+            )
+
+            # Ações em lote: só marcam a alteração; nada vai ao banco até "Aplicar"
+            selected = grid.selected_data
+            if selected is not None and len(selected):
+                st.write(f"{len(selected)} usuário(s) selecionado(s)")
+                col_grant, col_revoke, col_promote = st.columns(3)
+                staged_now = None
+                if col_grant.button("Liberar acesso", use_container_width=True):
+                    staged_now = {"acesso": True}
+                if col_revoke.button("Bloquear acesso", use_container_width=True):
+                    staged_now = {"acesso": False}
+                if col_promote.button("Promover a Admin", use_container_width=True):
+                    staged_now = {"admin": True}
+                if staged_now:
+                    for _, row in selected.iterrows():
+                        if staged_now.get("admin") and row["admin"]:
+                            continue  # já é administrador
+                        entry = staged.setdefault(row["cpf"], {"nome": f"{row['nome']} {row['sobrenome']}"})
+                        entry.update(staged_now)
+                        if entry.get("acesso") == row["acesso_liberado"]:
+                            entry.pop("acesso")  # igual ao que está no banco: não há o que mudar
+                        if len(entry) == 1:
+                            del staged[row["cpf"]]
+                    st.rerun()  # mostra a coluna "Alteração pendente" atualizada
+
+        # Navegação entre páginas
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("← Anterior", disabled=len(cursors) == 1, use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with col_page:
+            pages = max((total + page_size - 1) // page_size, 1)
+            st.markdown(f"<div style='text-align: center'>Página {len(cursors)} de {pages}</div>",
+                        unsafe_allow_html=True)
+        with col_next:
+            if st.button("Próxima →", disabled=next_cursor is None, use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
+
+    # Tentativas de login/recuperação recusadas antes do hash e do banco (deste processo)
+    with st.expander("Proteção de login"):
+        st.dataframe(
+            pd.DataFrame(throttle_stats()).T.rename_axis("Limite por"),
+            use_container_width=True
+        )
 else:
-    st.error("Acesso negado: apenas administradores podem acessar esta página")
-    st.switch_page("pages/2_pagina.py")
-    st.stop()
+    redirect("pages/2_pagina.py", "Acesso negado: apenas administradores podem acessar esta página", "error")
 
 with st.sidebar:
     if st.button(
@@ -220,10 +238,7 @@ with st.sidebar:
                  use_container_width=True,
                  type="primary",
                  ):
-        st.session_state.logged_in = False
-        st.session_state.is_admin = False
-        st.success("Você foi desconectado com sucesso!")
-        sleep(1)
-        st.switch_page("app.py")
+        end_session()
+        redirect("app.py", "Você foi desconectado com sucesso!")
 
 
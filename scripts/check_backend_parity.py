@@ -0,0 +1,145 @@
+"""Confere que os motores SQL do painel (core.engine) dão os mesmos números que o pandas.
+
+Rode a partir da raiz do projeto:
+
+    python scripts/check_backend_parity.py [--workbook documentos/download.xlsx] [--backend sqlite]
+
+O relatório é lido do catálogo, como na página (convertido antes, se o ingestor ainda
+não passou por ele). Para cada planilha compara, contra o caminho em pandas/NumPy
+(core.filters): os totais das métricas sem filtro e com filtros de UF, município e
+faixa de valor, as linhas que passam em cada filtro e a agregação dos gráficos. Por
+padrão testa o SQLite e, se estiver instalado, o DuckDB. Sai com código 1 se algum
+número diferir.
+"""
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.charts import prepare_chart_data
+from core.engine import DuckDBBackend, SQLiteBackend, duckdb
+from core.filters import Filters
+from core.catalog import list_reports
+from core.sheets import ingest_workbook, load_ingested, prepare_frame
+
+WORKBOOK = os.path.join("documentos", "download.xlsx")
+CHART_TYPES = ("Barras", "Pizza", "Linhas")
+
+
+def same(a, b):
+    """Iguais até o centavo (a ordem das somas muda de um motor para outro); vazio (None do
+    SQL ou NaN do pandas) só é igual a vazio"""
+    if pd.isna(a) or pd.isna(b):
+        return pd.isna(a) and pd.isna(b)
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    return math.isclose(a, b, rel_tol=1e-12, abs_tol=0.005)
+
+
+def cases(index):
+    """Sem filtro, cada UF, municípios de uma UF, uma faixa de valor e UF + faixa"""
+    yield Filters()
+    for uf in index.ufs:
+        yield Filters(ufs=(uf,))
+    if index.municipios:
+        yield Filters(municipios=tuple(index.municipios[:5]))
+        without_uf = [place for place in index.municipios if not place[0]]
+        if without_uf:
+            yield Filters(municipios=tuple(without_uf[:5]))
+    for column in index.schema['valor']:
+        bounds = index.bounds(column)
+        if bounds:
+            low, high = bounds
+            middle = (low + high) / 2
+            yield Filters(ranges=((column, low, middle),))
+            if index.ufs:
+                yield Filters(ufs=tuple(index.ufs[:1]), ranges=((column, middle, high),))
+
+
+def edge_sheet():
+    """Planilha pequena com o que os relatórios de exemplo não têm: linhas sem UF, o mesmo
+    município em UFs diferentes (e sem UF), valores vazios"""
+    return prepare_frame(pd.DataFrame({
+        "UF": ["SP", "SP", None, None, "RJ", "RJ", None, "MG"],
+        "MUNICÍPIO": ["A", "B", "A", "C", "A", None, "B", "10"],
+        "Valor efetivo de repasse": [1.0, 2.5, np.nan, 4.0, 8.0, 16.0, 32.0, 64.0],
+        "Qtde. eSF credenciadas": [1, 2, 3, 4, 5, 6, 7, 8],
+    }))
+
+
+def check_sheet(backend, key, sheet):
+    """Diferenças encontradas numa planilha: lista de mensagens"""
+    problems = []
+    index = sheet.index
+    for filters in cases(index):
+        expected = index.filtered_totals(filters)
+        got = backend.totals(key, sheet, filters)
+        for name in expected:
+            if not same(expected[name], got[name]):
+                problems.append(f"{filters}: total '{name}' {expected[name]!r} != {got[name]!r}")
+
+        mask = index.mask(filters)
+        expected_rows = list(range(index.rows)) if mask is None else mask.nonzero()[0].tolist()
+        if backend.positions(key, sheet, filters).tolist() != expected_rows:
+            problems.append(f"{filters}: linhas filtradas diferentes")
+
+        if not sheet.schema['valor']:
+            continue
+        value_col = sheet.schema['valor'][0]
+        for x_axis in [c for c in ("UF", "MUNICÍPIO") if c in sheet.df.columns]:
+            for chart_type in CHART_TYPES:
+                expected = prepare_chart_data(index.frame(filters), chart_type, x_axis, value_col)
+                got = backend.chart_data(key, sheet, chart_type, x_axis, value_col, filters)
+                rows_expected = expected.to_dict("records")
+                rows_got = got[expected.columns].to_dict("records") if set(got.columns) == set(expected.columns) else None
+                if rows_got is None or len(rows_got) != len(rows_expected) or not all(
+                    same(a[col], b[col]) for a, b in zip(rows_expected, rows_got) for col in expected.columns
+                ):
+                    problems.append(f"{filters}: gráfico {chart_type} por {x_axis} diferente")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workbook", default=WORKBOOK)
+    parser.add_argument("--backend", choices=["sqlite", "duckdb"], action="append",
+                        help="motor a conferir (padrão: sqlite e, se instalado, duckdb)")
+    args = parser.parse_args()
+
+    choices = args.backend or ["sqlite"] + (["duckdb"] if duckdb is not None else [])
+    if "duckdb" in choices and duckdb is None:
+        print("duckdb não está instalado")
+        return 1
+    backends = {"sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+    ingest_workbook(args.workbook)
+    source = os.path.basename(args.workbook)
+    report = next(r for r in list_reports(os.path.dirname(args.workbook)) if r.source == source)
+    names = report.sheet_names
+
+    failed = False
+    for choice in choices:
+        backend = backends[choice](max_tables=len(names) + 1)
+        problems = 0
+        for name in names:
+            sheet = load_ingested(report.path, report.version, name)
+            found = check_sheet(backend, (report.path, report.version, name), sheet)
+            for message in found:
+                print(f"  [{choice}] {name}: {message}")
+            problems += len(found)
+        found = check_sheet(backend, ("casos de borda", None, "casos de borda"), edge_sheet())
+        for message in found:
+            print(f"  [{choice}] casos de borda: {message}")
+        problems += len(found)
+        status = "ok" if not problems else f"{problems} diferença(s)"
+        print(f"{choice}: {len(names)} planilhas, {status}")
+        failed |= bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
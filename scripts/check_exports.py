@@ -0,0 +1,75 @@
+"""Confere que as exportações devolvem exatamente a planilha exportada.
+
+Rode a partir da raiz do projeto:
+
+    python scripts/check_exports.py [--rows 60000]
+
+Monta uma planilha com texto, inteiros, decimais e vazios, gera o CSV e o xlsx (acima
+de XLSX_FAST_ROWS linhas o xlsx passa pelo escritor de streaming), lê os arquivos de
+volta e compara com a original. Com o xlsxwriter instalado confere também o caminho
+do openpyxl. Sai com código 1 se algum arquivo diferir.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.exports as exports
+from core.exports import XLSX_FAST_ROWS, csv_bytes, excel_bytes
+
+
+def sample(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    value = rng.uniform(-1000, 100000, rows).round(2)
+    value[::13] = np.nan
+    return pd.DataFrame({
+        "UF": np.array(["SP", "RJ", "MG", "BA"])[np.arange(rows) % 4],
+        "MUNICÍPIO": [f"MUNICIPIO {i:06d}" for i in range(rows)],
+        "IBGE": 100000 + np.arange(rows),
+        "Valor": value,
+        "Qtde.": rng.integers(0, 50, rows),
+    })
+
+
+def differences(expected, got):
+    """Colunas em que `got` difere de `expected` (valores, não tipos)"""
+    if list(got.columns) != list(expected.columns) or len(got) != len(expected):
+        return [f"forma {got.shape} != {expected.shape}"]
+    return [col for col in expected.columns
+            if not expected[col].astype(object).where(expected[col].notna(), None).tolist()
+            == got[col].astype(object).where(got[col].notna(), None).tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=XLSX_FAST_ROWS + 10000)
+    args = parser.parse_args()
+    df = sample(args.rows)
+
+    checks = [("CSV", lambda: pd.read_csv(csv_bytes(df)))]
+    writers = ["xlsxwriter", "openpyxl"] if exports.xlsxwriter is not None else ["openpyxl"]
+    for writer in writers:
+        def read_excel(writer=writer):
+            saved = exports.xlsxwriter
+            if writer == "openpyxl":
+                exports.xlsxwriter = None
+            try:
+                return pd.read_excel(excel_bytes(df, "Planilha"))
+            finally:
+                exports.xlsxwriter = saved
+        checks.append((f"Excel ({writer})", read_excel))
+
+    failed = False
+    for name, read in checks:
+        diff = differences(df, read())
+        print(f"{name}: {len(df)} linhas, {'ok' if not diff else 'diferente em ' + ', '.join(diff)}")
+        failed |= bool(diff)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Confere com EXPLAIN que as buscas do painel de administração usam os índices.
+
+Rode a partir da raiz do projeto (precisa do .streamlit/secrets.toml):
+
+    python scripts/check_search_plan.py [--force-index]
+
+Com poucos usuários o planejador prefere varrer a tabela inteira; --force-index
+desliga a varredura sequencial só nesta transação, para provar que o índice atende
+a consulta. Sai com código 1 se a consulta de alguma página não usar o índice esperado.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.pool import db_connection
+from core.users import has_trigram_index, page_query
+
+
+def plan_indexes(node):
+    """Nomes dos índices usados em qualquer nó do plano"""
+    found = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        found |= plan_indexes(child)
+    return found
+
+
+def cases():
+    prefix_indexes = {"users_nome_busca_idx", "users_sobrenome_busca_idx"}
+    name_indexes = ({"users_nome_busca_trgm_idx", "users_sobrenome_busca_trgm_idx"} if has_trigram_index()
+                    else prefix_indexes)
+    # (descrição, busca, acesso, admin, índices aceitos)
+    return [
+        ("prefixo de CPF", "123", "Todos", "Todos", {"users_cpf_prefix_idx"}),
+        ("CPF com máscara", "123.456", "Todos", "Todos", {"users_cpf_prefix_idx"}),
+        ("nome sem acento", "joão", "Todos", "Todos", name_indexes),
+        # Abaixo de TRGM_MIN_CHARS o trigrama não ajuda: vai pelo prefixo
+        ("nome curto", "jo", "Todos", "Todos", prefix_indexes),
+        ("bloqueados", "", "Bloqueados", "Todos", {"users_bloqueados_idx"}),
+        ("administradores", "", "Todos", "Administradores", {"users_admins_idx"}),
+        ("sem filtro", "", "Todos", "Todos", {"users_created_at_id_idx"}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--force-index", action="store_true",
+                        help="desliga a varredura sequencial (tabelas pequenas)")
+    args = parser.parse_args()
+
+    failures = 0
+    with db_connection() as conn, conn.cursor() as cur:
+        if args.force_index:
+            cur.execute("SET LOCAL enable_seqscan = off")
+        for label, term, access, admin, expected in cases():
+            for kind, (sql, params) in zip(("página", "contagem"), page_query(term, access, admin)):
+                if kind == "contagem" and not term and access == admin == "Todos":
+                    continue  # contar a tabela inteira não tem índice que ajude
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = plan_indexes(plan[0]["Plan"])
+                if kind == "contagem":
+                    # A contagem lê todas as linhas do filtro: se ele pega boa parte da
+                    # tabela, varrer tudo é a escolha certa. Só informa.
+                    status = "info"
+                else:
+                    status = "ok" if used & expected else "FALHOU"
+                    failures += status == "FALHOU"
+                print(f"{status:6} {label} ({kind}): {', '.join(sorted(used)) or 'seq scan'}")
+        conn.rollback()
+    print(f"pg_trgm: {'sim' if has_trigram_index() else 'não (busca por nome só por prefixo)'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import uuid
+
+import streamlit as st
+
+from core.auth import is_stale, load_user
+
+
+def session_key():
+    """Identificador desta sessão do navegador (chave do limite de tentativas por sessão)"""
+    return st.session_state.setdefault("throttle_session", uuid.uuid4().hex)
+
+
+def start_session(user):
+    st.session_state.user = user
+
+
+def end_session():
+    st.session_state.pop("user", None)
+
+
+def current_user():
+    """Usuário logado nesta sessão, ou None.
+
+    Só vai ao banco quando o perfil venceu (SESSION_TTL) ou o usuário foi alterado;
+    quem teve o acesso bloqueado ou foi removido sai da sessão.
+    """
+    user = st.session_state.get("user")
+    if user is None or not is_stale(user):
+        return user
+    try:
+        fresh = load_user(user.cpf)
+    except Exception:
+        return user  # banco fora do ar: segue com o perfil atual e tenta de novo na próxima página
+    if fresh is None or not fresh.acesso_liberado:
+        end_session()
+        return None
+    start_session(fresh)
+    return fresh